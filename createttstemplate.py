@@ -19,6 +19,79 @@ import re
 import sys
 from pathlib import Path
 
+import ttsutil
+
+PROGRESS_INTERVAL = 64  # print a progress line every this many created entries
+SKIP_DIRS: frozenset[str] = frozenset({"voicelines"})  # sounds subdirectories that don't contain TTS files
+
+# link colour letters following a link count, e.g. the "b" in "4b"
+LINK_COLOUR_RE: re.Pattern[str] = re.compile(r"(\d)([bgrw])")
+# phonetic spelling of each link colour letter, since some models are bad at pronouncing letters
+LINK_COLOUR_WORDS: dict[str, str] = {"b": " bee ", "g": " jee ", "r": " arr ", "w": " white"}
+# one-handed / two-handed weapon class abbreviations
+HANDED_RE: re.Pattern[str] = re.compile(r"[12]h")
+# trailing rarity words moved to the front of the text, in this order, e.g. "ruby ring rare" -> "rare ruby ring"
+RARITIES_TO_FRONT: tuple[str, ...] = ("rare", "magic")
+# redundant currency prefixes and suffixes, first match wins:
+# (match only at start of text, text to match, text to remove, occurrences to remove or -1 for all)
+CURRENCY_REWRITES: tuple[tuple[bool, str, str, int], ...] = (
+    (True, "orb of ", "orb of ", 1),
+    (False, " orb", " orb", -1),
+    (True, "scroll of ", "scroll of ", 1),
+    (False, " scroll", " scroll", -1),
+    (True, "blacksmiths whetstone", "blacksmiths ", 1),
+    (True, "armourers scrap", " scrap", -1),
+)
+
+
+def default_tts_text(entry_path: str) -> str:
+    """Create the default TTS text for a template entry from its path.
+
+    Args:
+        entry_path (str): template path relative to the sounds dir, with "/" separators.
+
+    Returns:
+        str: plain TTS text, based on the file name.
+
+    """
+    text: str = entry_path.rpartition("/")[2].removesuffix(".mp3")
+
+    # move 'rare' or 'magic' to front of text if it ends with it
+    for rarity in RARITIES_TO_FRONT:
+        head, sep, tail = text.rpartition(" ")
+        if sep and tail == rarity:
+            text = f"{tail} {head}"
+    # remove redundant currency prefixes and suffixes such as "orb of " or " orb"
+    if "currency/" in entry_path:
+        for at_start, match, remove, count in CURRENCY_REWRITES:
+            if text.startswith(match) if at_start else match in text:
+                text = text.replace(remove, "", count)
+                break
+    # some models are bad at pronouncing letters, so spell link letters phonetically
+    if "links/" in entry_path:
+        text = LINK_COLOUR_RE.sub(lambda m: m.group(1) + LINK_COLOUR_WORDS[m.group(2)], text)
+        text = text.replace("  ", " ")  # charged per char, remove double spaces
+
+    return text
+
+
+def default_ssml_text(tts_text: str) -> str:
+    """Create the default SSML text for a template entry from its TTS text.
+
+    Args:
+        tts_text (str): plain TTS text of the entry.
+
+    Returns:
+        str: SSML marked up text, or empty string if no markup is needed.
+
+    """
+    ssml_text: str = ""
+    # if tts text is multiple words or is at least 10 characters, set fast rate prosody ssml
+    if " " in tts_text or len(tts_text) >= 10:
+        ssml_text = "<prosody rate='fast'>" + tts_text + "</prosody>"
+    # literal pronunciation if text contains '1h' or '2h' (otherwise advanced TTS reads "hour")
+    return HANDED_RE.sub(r"<say-as interpret-as='characters'>\g<0></say-as>", ssml_text)
+
 
 def main() -> int:
     """Create or update a TTS template json file from an existing TTS directory.
@@ -41,104 +114,56 @@ def main() -> int:
         print(f"Error: directory '{directory}' does not exist.")
         return 1
 
+    sounds_dir: Path = directory / "sounds"
+    if not sounds_dir.is_dir():
+        print(f"Error: required subdirectory '{sounds_dir}' does not exist.")
+        return 1
+
     template: list[dict[str, str]] = []
     file_exists: bool = Path(args.file).is_file()
     if file_exists:
         try:
-            with Path(args.file).open(encoding="utf-8") as f:
-                template = json.load(f)
+            template = ttsutil.load_template(Path(args.file))
         except (json.JSONDecodeError, UnicodeDecodeError) as e:
             print(f"{type(e)}: {e}")
             return 1
 
+    # index existing entry paths once so duplicate checks are O(1) instead of a scan of the template
+    existing_paths: set[str] = {ttsutil.canonical_path(entry["path"]) for entry in template}
+
     created_count: int = 0
     skipped_count: int = 0
     # Create template data structure from existing directory structure.
-    # os.walk does not guarantee order, but Windows seems to return files in order,
-    # while Linux does not, if order matters to you
-    # Use rglob to find mp3 files under the directory
-    for path in directory.rglob("*.mp3"):
-        root = str(path.parent)
-        filename = path.name
-
-        # skip files in voicelines dir since they're not TTS files
-        if "voicelines" in root:
-            continue
-
-        # get path relative to sounds dir, remove leading path separator if present
-        try:
-            entry_path: str = str(path.relative_to(directory / "sounds")).lstrip("/")
-        except Exception:
-            # Skip files not under a sounds/ directory
-            continue
-
+    # os.scandir does not guarantee order, but Windows seems to return files in order,
+    # while Linux does not, if order matters to you.
+    # voicelines and hidden dirs are pruned from the walk since they don't contain TTS files.
+    for _, entry_path in ttsutil.walk_mp3(sounds_dir, SKIP_DIRS, skip_hidden=True):
         # skip if entry path already exists in template list
-        if any(entry["path"] == entry_path for entry in template):
+        if ttsutil.canonical_path(entry_path) in existing_paths:
             skipped_count += 1
             continue
 
-        entry_tts_text: str = filename.removesuffix(".mp3")
-
-        # move 'rare' to front of text if it ends with 'rare'
-        if entry_tts_text.endswith(" rare"):
-            entry_tts_text = "rare " + entry_tts_text.removesuffix(" rare")
-        # move 'magic' to front of text if it ends with 'magic'
-        if entry_tts_text.endswith(" magic"):
-            entry_tts_text = "magic " + entry_tts_text.removesuffix(" magic")
-        # remove redundant currency prefixes and suffixes such as "orb of " or " orb"
-        if "currency/" in entry_path:
-            if entry_tts_text.startswith("orb of "):
-                entry_tts_text = entry_tts_text.removeprefix("orb of ")
-            elif " orb" in entry_tts_text:
-                entry_tts_text = entry_tts_text.replace(" orb", "")
-            elif entry_tts_text.startswith("scroll of "):
-                entry_tts_text = entry_tts_text.removeprefix("scroll of ")
-            elif " scroll" in entry_tts_text:
-                entry_tts_text = entry_tts_text.replace(" scroll", "")
-            elif entry_tts_text.startswith("blacksmiths whetstone"):
-                entry_tts_text = entry_tts_text.removeprefix("blacksmiths ")
-            elif entry_tts_text.startswith("armourers scrap"):
-                entry_tts_text = entry_tts_text.replace(" scrap", "")
-        # some models are bad at pronouncing letters, so spell link letters phonetically
-        if "links/" in entry_path:
-            matches: list = re.findall(r"\d[bgrw]", entry_tts_text)
-            for match in matches:
-                if "b" in match:
-                    entry_tts_text = entry_tts_text.replace(match, f"{match[0]} bee ")
-                elif "g" in match:
-                    entry_tts_text = entry_tts_text.replace(match, f"{match[0]} jee ")
-                elif "r" in match:
-                    entry_tts_text = entry_tts_text.replace(match, f"{match[0]} arr ")
-                elif "w" in match:
-                    entry_tts_text = entry_tts_text.replace(match, f"{match[0]} white")
-            entry_tts_text = entry_tts_text.replace("  ", " ")  # charged per char, remove double spaces
-
-        entry_ssml_text: str = ""
-        # if tts text is multiple words or is at least 10 characters, set fast rate prosody ssml
-        if " " in entry_tts_text or len(entry_tts_text) >= 10:
-            entry_ssml_text = "<prosody rate='fast'>" + entry_tts_text + "</prosody>"
-        # literal pronunciation if text contains '1h' or '2h' (otherwise advanced TTS reads "hour")
-        if "1h" in entry_ssml_text:
-            entry_ssml_text = entry_ssml_text.replace("1h", "<say-as interpret-as='characters'>1h</say-as>")
-        if "2h" in entry_ssml_text:
-            entry_ssml_text = entry_ssml_text.replace("2h", "<say-as interpret-as='characters'>2h</say-as>")
-
-        template.insert(
-            created_count + skipped_count + 1,
-            {"path": entry_path, "tts_text": entry_tts_text, "ssml_text": entry_ssml_text},
-        )
-        created_count += 1
-        if created_count > 1:
-            print("\033[1A", end="\x1b[2K")
-        print(f"Created entry {created_count}: {template[created_count + skipped_count - 1]}", flush=True)
-
-    # create json string from template data structure
-    template_json: str = json.dumps(template, indent=4)
+        entry_tts_text: str = default_tts_text(entry_path)
+        entry_ssml_text: str = default_ssml_text(entry_tts_text)
 
-    # output json to file
+        template.append({"path": entry_path, "tts_text": entry_tts_text, "ssml_text": entry_ssml_text})
+        existing_paths.add(ttsutil.canonical_path(entry_path))
+        created_count += 1
+        # redrawing the progress line is slow compared to creating an entry, so only do it periodically
+        if created_count == 1 or created_count % PROGRESS_INTERVAL == 0:
+            if created_count > 1:
+                print("\033[1A", end="\x1b[2K")
+            print(f"Created entry {created_count}: {template[-1]}", flush=True)
+
+    # nothing to add to an existing template, so don't spend time re-serializing and rewriting it
+    if file_exists and created_count == 0:
+        print(f"No new entries, existing file '{args.file}' left unchanged. {skipped_count} existing entries skipped.")
+        return 0
+
+    # output json to file, streamed rather than building the whole string in memory first
     try:
         with Path(args.file).open("w", encoding="utf-8") as f:
-            f.write(template_json)
+            json.dump(template, f, indent=4)
     except OSError as e:
         print(f"{type(e)}: {e}")
         return 1
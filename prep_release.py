@@ -2,13 +2,186 @@
 """Create release assets such as .zip files of TTS voice soundpack directories + audio preview files."""
 
 import argparse
+import hashlib
 import json
+import os
 import shutil
+import subprocess
 import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import ffmpeg
 
+import ttsutil
+
+# --compress choices: (zipfile compression method, compresslevel).
+# mp3 is already compressed, so DEFLATE spends CPU time for almost no size reduction.
+ZIP_COMPRESSION: dict[str, tuple[int, int | None]] = {
+    "store": (zipfile.ZIP_STORED, None),
+    "fast": (zipfile.ZIP_DEFLATED, 1),
+    "normal": (zipfile.ZIP_DEFLATED, 6),
+}
+# the same --compress choices as `zip` command line compression level options
+ZIP_CLI_LEVELS: dict[str, str] = {"store": "-0", "fast": "-1", "normal": "-6"}
+
+
+def make_zip(
+    root_dir: Path, zip_file: Path, compress: str = "store", files: list[tuple[str, str]] | None = None
+) -> None:
+    """Write a .zip file of a directory and all of its files.
+
+    Args:
+        root_dir (Path): the directory to zip. Archive paths are relative to it.
+        zip_file (Path): the .zip file to create, overwritten if it exists.
+        compress (str): one of ZIP_COMPRESSION's keys. Default "store".
+        files (list[tuple[str, str]], optional): (path, relative path) of all files in root_dir as
+            yielded by ttsutil.walk_files(), if already known, to avoid walking the directory again.
+            Defaults to walking root_dir.
+
+    """
+    if files is None:
+        files = list(ttsutil.walk_files(root_dir))
+    compression, compresslevel = ZIP_COMPRESSION[compress]
+    with zipfile.ZipFile(zip_file, "w", compression=compression, compresslevel=compresslevel) as zf:
+        for path, relpath in sorted(files, key=lambda file: file[1]):
+            zf.write(path, arcname=relpath)
+
+
+def make_zip_cli(root_dir: Path, zip_file: Path, compress: str = "store") -> None:
+    """Write a .zip file of a directory and all of its contents with the external `zip` program.
+
+    Avoids Python per-file overhead, which helps for soundpacks with many small files.
+
+    Args:
+        root_dir (Path): the directory to zip. Archive paths are relative to it.
+        zip_file (Path): the .zip file to create, overwritten if it exists.
+        compress (str): one of ZIP_CLI_LEVELS's keys. Default "store".
+
+    Raises:
+        subprocess.CalledProcessError: If zip fails.
+
+    """
+    zip_file = zip_file.resolve()
+    zip_file.unlink(missing_ok=True)  # zip adds to an existing archive instead of replacing it
+    subprocess.run(["zip", "-q", "-r", ZIP_CLI_LEVELS[compress], str(zip_file), "."], cwd=root_dir, check=True)
+
+
+def build_zip(
+    soundpackdir: str,
+    files: list[tuple[str, str]],
+    inputdir: Path,
+    outputdir: Path,
+    compress: str = "store",
+    *,
+    zip_cli: bool = False,
+) -> tuple[str, Path]:
+    """Make the .zip file for a single soundpack directory.
+
+    Args:
+        soundpackdir (str): name of the soundpack directory in inputdir
+        files (list[tuple[str, str]]): (path, relative path) of all files in the soundpack directory
+        inputdir (Path): the input directory containing soundpack dirs
+        outputdir (Path): the output directory to write release files to
+        compress (str): zip compression, one of ZIP_COMPRESSION's keys. Default "store".
+        zip_cli (bool): use the external `zip` program instead of Python's zipfile. Default False.
+
+    Returns:
+        tuple[str, Path]: (soundpack dir name, zip file path)
+
+    """
+    zip_path: Path = outputdir / f"{soundpackdir}.zip"
+    if zip_cli:
+        make_zip_cli(inputdir / soundpackdir, zip_path, compress)
+    else:
+        make_zip(inputdir / soundpackdir, zip_path, compress, files)
+    # appending only rewrites the central directory at the end of the file, not the archived files
+    with zipfile.ZipFile(zip_path, "a") as zf:
+        zf.comment = zip_manifest_digest(files, compress, zip_cli=zip_cli).encode()
+    return soundpackdir, zip_path
+
+
+def zip_manifest_digest(files: list[tuple[str, str]], compress: str, *, zip_cli: bool) -> str:
+    """Hash the file names and zip settings of a soundpack zip, stored as the zip's comment.
+
+    A renamed file keeps its mtime, so mtimes alone can't tell that a zip lists an old name.
+
+    Args:
+        files (list[tuple[str, str]]): (path, relative path) of all files in the soundpack directory
+        compress (str): zip compression, one of ZIP_COMPRESSION's keys
+        zip_cli (bool): whether the zip is made with the external `zip` program
+
+    Returns:
+        str: hex digest that changes if a file is added, removed or renamed, or a zip setting changes
+
+    """
+    manifest: list[object] = [compress, zip_cli, sorted(relpath for _, relpath in files)]
+    return hashlib.sha256(json.dumps(manifest).encode()).hexdigest()
+
+
+def is_zip_up_to_date(zip_path: Path, source_mtime_ns: int, digest: str) -> bool:
+    """Check if a soundpack zip is newer than its files, and was made from the same file names and settings.
+
+    Args:
+        zip_path (Path): the soundpack zip file
+        source_mtime_ns (int): the newest st_mtime_ns of the soundpack files
+        digest (str): zip_manifest_digest() of the soundpack's current files and the zip settings
+
+    Returns:
+        bool: True if zip_path is up to date, False if it's missing, older, or its comment doesn't match
+
+    """
+    if not is_up_to_date(zip_path, source_mtime_ns):
+        return False
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            return zf.comment == digest.encode()
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+def is_up_to_date(output_path: Path, source_mtime_ns: int) -> bool:
+    """Check if a release file was written after the newest file it's made from was modified.
+
+    Args:
+        output_path (Path): the release file
+        source_mtime_ns (int): the newest st_mtime_ns of the files it's made from
+
+    Returns:
+        bool: True if output_path exists and is at least as new as source_mtime_ns
+
+    """
+    return output_path.exists() and output_path.stat().st_mtime_ns >= source_mtime_ns
+
+
+def start_previews(preview_paths: list[tuple[Path, Path]]) -> subprocess.Popen[bytes]:
+    """Start one ffmpeg process in the background that makes the preview files of several soundpacks.
+
+    Github README.md only supports video embeds, so the audio is put in a video container.
+    Each preview is only a few seconds of audio, so a process per preview would mostly be spent
+    starting ffmpeg. Instead every input is mapped to its own output in a single ffmpeg command.
+
+    Args:
+        preview_paths (list[tuple[Path, Path]]): (soundpack audio file to preview, preview file to create)
+            for each preview. Existing preview files are overwritten.
+
+    Returns:
+        subprocess.Popen[bytes]: the running ffmpeg process, with stdout and stderr piped
+
+    """
+    return (
+        ffmpeg.merge_outputs(
+            *(
+                ffmpeg.input(str(preview_input_path)).output(filename=str(preview_output_path))
+                for preview_input_path, preview_output_path in preview_paths
+            )
+        )
+        .global_args(hide_banner=True, loglevel="error")
+        .run_async(cmd=ttsutil.FFMPEG_BIN, quiet=True, overwrite_output=True)
+    )
+
 
 def main() -> int:
     """Make .zip files of TTS soundpack directories for uploading with a github release.
@@ -35,6 +208,26 @@ def main() -> int:
         default=str(Path.home() / "ttszips"),
     )
     parser.add_argument("-f", "--file", help="the name of the input json template file", default="template.json")
+    parser.add_argument(
+        "-c",
+        "--compress",
+        help="zip compression: store (none, fastest, mp3 is already compressed), fast (deflate level 1), "
+        "or normal (deflate level 6)",
+        choices=ZIP_COMPRESSION.keys(),
+        default="store",
+    )
+    parser.add_argument(
+        "--fast-zip",
+        help="create zips with the external `zip` program, which must be on PATH",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--force",
+        help="recreate all release files, even ones that are newer than their soundpack files",
+        action="store_true",
+        default=False,
+    )
     args: argparse.Namespace = parser.parse_args()
 
     inputdir = Path(args.inputdir)
@@ -44,87 +237,152 @@ def main() -> int:
         print(f"Error: input directory '{inputdir}' does not exist.")
         return 1
 
+    if args.fast_zip and shutil.which("zip") is None:
+        print("Error: --fast-zip requires the `zip` program, which was not found on PATH.")
+        return 1
+
     if not outputdir.exists():
         outputdir.mkdir(mode=0o755, parents=True, exist_ok=True)
 
-    with Path.open(args.file, encoding="utf-8") as f:
-        try:
-            template: list[dict[str, str]] = json.load(f)
-        except (json.JSONDecodeError, UnicodeDecodeError) as e:
-            print(f"{type(e)}: {e}")
-            return 1
+    try:
+        template: list[dict[str, str]] = ttsutil.load_template(Path(args.file))
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        print(f"{type(e)}: {e}")
+        return 1
 
-    soundpackdirs: list[str] = [p.name for p in inputdir.iterdir() if p.is_dir() and (p / "sounds").is_dir()]
+    # DirEntry.is_dir() uses the file type from the directory listing, so only "sounds" needs a stat
+    with os.scandir(inputdir) as it:
+        soundpackdirs: list[str] = [e.name for e in it if e.is_dir() and os.path.isdir(os.path.join(e.path, "sounds"))]
 
-    # Check if all files in the template exist in each soundpack directory
-    missing_file: bool = False
+    # Walk each soundpack directory once, then check both ways with set lookups:
+    # template files missing from the soundpack, and soundpack .mp3 files missing from the template.
+    # Each soundpack's file list is kept so zipping doesn't have to walk the directory again.
+    template_paths: dict[str, str] = {ttsutil.canonical_path(entry["path"]): entry["path"] for entry in template}
+    pack_files: dict[str, list[tuple[str, str]]] = {}
+    missing_files: list[tuple[str, Path]] = []
+    extra_files: list[str] = []
     for soundpackdir in soundpackdirs:
-        for item in template:
-            file_partialpath: str = item["path"]
-            file_fullpath: Path = inputdir / soundpackdir / "sounds" / file_partialpath
-            # skip if file already exists
-            if not file_fullpath.exists():
-                missing_file = True
-                print(f"Warning: TTS file '{file_fullpath}' does not exist in soundpack directory '{soundpackdir}'")
-
-    if missing_file:
-        print("TTS files specified in template are missing in one or more soundpack directories.")
-        if input("Continue anyway? y/n: ").strip().lower() != "y":
-            return 1
-    else:
-        print("Successful check: All TTS files specified in template file exist in all soundpack directories.")
+        pack_files[soundpackdir] = list(ttsutil.walk_files(inputdir / soundpackdir))
+        # canonical sounds-relative path -> full path, for every file in the sounds dir
+        present: dict[str, str] = {
+            ttsutil.canonical_path(relpath.removeprefix("sounds/")): path
+            for path, relpath in pack_files[soundpackdir]
+            if relpath.startswith("sounds/")
+        }
 
-    # Check if any .mp3 files in each soundpack directory do not exist in the template
-    extra_file: bool = False
-    for soundpackdir in soundpackdirs:
-        soundpackdir_path: Path = inputdir / soundpackdir
-        sounds_root = soundpackdir_path / "sounds"
-        for path in sounds_root.rglob("*.mp3"):
-            root = str(path.parent)
-            filename = path.name
-            # skip non-.mp3 files (rglob already filters)
+        missing_files.extend(
+            (soundpackdir, inputdir / soundpackdir / "sounds" / file_partialpath)
+            for canonical, file_partialpath in template_paths.items()
+            if canonical not in present
+        )
+
+        for entry_path, path in present.items():
+            root, filename = os.path.split(entry_path)
+            # skip non-.mp3 files
             # skip files in voicelines dir since they're not TTS files
             # skip quest_item.mp3 since it's not a TTS file
-            if "voicelines" in root or filename == "quest item.mp3":
+            if not filename.endswith(".mp3") or "voicelines" in root or filename == "quest item.mp3":
                 continue
+            if entry_path not in template_paths:
+                extra_files.append(path)
 
-            # get path relative to sounds dir
-            entry_path: str = str(path.relative_to(sounds_root)).lstrip("/")
+    for soundpackdir, file_fullpath in missing_files:
+        print(f"Warning: TTS file '{file_fullpath}' does not exist in soundpack directory '{soundpackdir}'")
+
+    if missing_files:
+        print("TTS files specified in template are missing in one or more soundpack directories.")
+        if input("Continue anyway? y/n: ").strip().lower() != "y":
+            return 1
+    else:
+        print("Successful check: All TTS files specified in template file exist in all soundpack directories.")
 
-            # skip if entry path already exists in template list
-            if not any(entry["path"] == entry_path for entry in template):
-                extra_file = True
-                print(f"Warning: File '{path}' does not exist in template file.")
+    for path in extra_files:
+        print(f"Warning: File '{path}' does not exist in template file.")
 
-    if extra_file:
+    if extra_files:
         print("One or more .mp3 files in a soundpack directory do not exist in template file.")
         if input("Continue anyway? y/n: ").strip().lower() != "y":
             return 1
     else:
         print("Successful check: All .mp3 files in soundpack directories exist in template file.")
 
-    # Generate release files
+    # Generate release files.
+    # Stat every soundpack file once for both the pack's total size and its newest modification time.
+    # A release file that is newer than everything it's made from is up to date and is not recreated.
+    # Zips must also match the soundpack's file names and the zip settings, see zip_manifest_digest().
+    pack_sizes: dict[str, int] = {}
+    pack_mtimes: dict[str, int] = {}
+    for soundpackdir, files in pack_files.items():
+        stats: list[os.stat_result] = [os.stat(path) for path, _ in files]
+        pack_sizes[soundpackdir] = sum(st.st_size for st in stats)
+        pack_mtimes[soundpackdir] = max((st.st_mtime_ns for st in stats), default=0)
+
+    retcode: int = 0
+    # soundpack dir -> (preview input path, preview output path) of each preview that needs to be made
+    stale_previews: dict[str, tuple[Path, Path]] = {}
+    missing_previews: set[str] = set()
     for soundpackdir in soundpackdirs:
-        soundpackdir_path: Path = inputdir / soundpackdir
+        preview_input_path: Path = inputdir / soundpackdir / "sounds" / "currency" / "chaos orb.mp3"
+        preview_output_path: Path = outputdir / f"{soundpackdir}.mp4"
+        if not preview_input_path.exists():
+            # checked here since a missing input would make ffmpeg fail every preview, not just this one
+            print(f"Error: preview source file '{preview_input_path}' does not exist.")
+            missing_previews.add(soundpackdir)
+            retcode = 1
+        elif args.force or not is_up_to_date(preview_output_path, preview_input_path.stat().st_mtime_ns):
+            stale_previews[soundpackdir] = (preview_input_path, preview_output_path)
 
-        zip_path: Path = outputdir / soundpackdir
+    # Start the preview ffmpeg process first so it runs in the background while the zips are built.
+    preview_process: subprocess.Popen[bytes] | None = (
+        start_previews(list(stale_previews.values())) if stale_previews else None
+    )
 
-        # Make a zip file of the soundpack directory
-        shutil.make_archive(base_name=str(zip_path), format="zip", root_dir=str(soundpackdir_path))
+    zip_paths: dict[str, Path] = {}
+    for soundpackdir in soundpackdirs:
+        zip_path: Path = outputdir / f"{soundpackdir}.zip"
+        digest: str = zip_manifest_digest(pack_files[soundpackdir], args.compress, zip_cli=args.fast_zip)
+        if not args.force and is_zip_up_to_date(zip_path, pack_mtimes[soundpackdir], digest):
+            zip_paths[soundpackdir] = zip_path
+    # Each soundpack is independent and zipping is CPU-bound, so build them in parallel.
+    # Submit the largest soundpacks first so a big one started last doesn't leave the other workers idle.
+    largest_first: list[str] = sorted(
+        (soundpackdir for soundpackdir in soundpackdirs if soundpackdir not in zip_paths),
+        key=pack_sizes.__getitem__,
+        reverse=True,
+    )
+    up_to_date_zips: set[str] = set(zip_paths)
+    with ProcessPoolExecutor() as executor:
+        for soundpackdir, zip_path in executor.map(
+            partial(
+                build_zip, inputdir=inputdir, outputdir=outputdir, compress=args.compress, zip_cli=args.fast_zip
+            ),
+            largest_first,
+            [pack_files[soundpackdir] for soundpackdir in largest_first],
+        ):
+            zip_paths[soundpackdir] = zip_path
 
-        # Make a preview audio file of the soundpack.
-        # Github README.md only supports video embeds, so put the audio in a video container.
-        preview_input_path: Path = soundpackdir_path / "sounds" / "currency" / "chaos orb.mp3"
-        preview_output_path: Path = outputdir / f"{soundpackdir}.mp4"
-        ffmpeg.input(str(preview_input_path)).output(filename=str(preview_output_path)).run(
-            quiet=True, overwrite_output=True
-        )
+    if preview_process is not None:
+        _, stderr = preview_process.communicate()
+        if preview_process.returncode:
+            print(f"Error: ffmpeg failed to create previews: {stderr.decode(errors='replace')}")
+            return 1
 
-        print(
-            f"Created zip '{zip_path}'.zip and preview '{preview_output_path}' from soundpack dir '{soundpackdir_path}'"
-        )
+    for soundpackdir in soundpackdirs:
+        created: list[str] = []
+        if soundpackdir not in up_to_date_zips:
+            created.append(f"zip '{zip_paths[soundpackdir]}'")
+        if soundpackdir in stale_previews:
+            created.append(f"preview '{stale_previews[soundpackdir][1]}'")
+        without_preview: str = " without preview" if soundpackdir in missing_previews else ""
+        if not created:
+            if without_preview:
+                print(f"Zip for soundpack dir '{inputdir / soundpackdir}' is up to date{without_preview}, skipped.")
+            else:
+                print(f"Zip and preview for soundpack dir '{inputdir / soundpackdir}' are up to date, skipped.")
+            continue
+        print(f"Created {' and '.join(created)}{without_preview} from soundpack dir '{inputdir / soundpackdir}'")
 
-    return 0
+    return retcode
 
 
 if __name__ == "__main__":
@@ -23,18 +23,27 @@ ssml_text: (optional) SSML marked up text, empty string if none
 """
 
 import argparse
-import json
+import hashlib
 import logging
 import os
+import random
+import re
 import sys
-import tempfile
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from contextlib import closing
+from functools import partial
 from json import JSONDecodeError
 from pathlib import Path
-from typing import TYPE_CHECKING, Literal, get_args
+from typing import TYPE_CHECKING, Any, Literal, get_args
+from urllib.parse import unquote, urlparse
 
 import ffmpeg
 from boto3 import Session
+from botocore.client import BaseClient
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
 from ffmpeg import FFMpegExecuteError
 from mypy_boto3_polly.client import PollyClient
@@ -48,11 +57,694 @@ from mypy_boto3_polly.literals import (
 import ttsutil
 
 if TYPE_CHECKING:
-    from mypy_boto3_polly.type_defs import SynthesizeSpeechOutputTypeDef
+    from mypy_boto3_polly.type_defs import DescribeVoicesOutputTypeDef, SynthesizeSpeechOutputTypeDef
 
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_WORKERS = 8  # template items processed at once, Polly requests are network bound
+# Polly client settings: enough pooled keep-alive connections for all worker threads, so TLS handshakes
+# aren't repeated, and adaptive retries, which back off client-side when Polly throttles requests.
+POLLY_CLIENT_CONFIG = Config(
+    max_pool_connections=32,
+    tcp_keepalive=True,
+    retries={"mode": "adaptive", "max_attempts": 10},
+    connect_timeout=5,
+    read_timeout=30,
+)
+# supported Polly audio output formats and their file extensions ("json" is speech marks, not audio)
+OUTPUT_FORMAT_EXTENSIONS: dict[str, str] = {"mp3": ".mp3", "ogg_vorbis": ".ogg", "pcm": ".pcm"}
+# error codes of throttled requests that are retried after botocore's own retries are used up
+THROTTLING_ERROR_CODES: frozenset[str] = frozenset({"ThrottlingException", "TooManyRequestsException", "Throttling"})
+THROTTLE_RETRIES = 5  # extra attempts of a throttled Polly request before giving up
+THROTTLE_BACKOFF_BASE = 1.0  # seconds before the first throttled retry, doubled for each later one
+THROTTLE_BACKOFF_MAX = 30.0  # max seconds between throttled retries
+PROGRESS_INTERVAL = 64  # log a progress line every this many created files, each file is logged at DEBUG
+# plain text longer than this is synthesized in chunks of at most this length and joined, since
+# synthesize_speech rejects text over 3000 characters (1500 billed characters in some regions)
+MAX_TEXT_CHARS = 1400
+DEFAULT_CACHE_DIR: Path = ttsutil.CACHE_ROOT / "awspolly"  # default directory of cached output files
+TASK_POLL_INTERVAL = 2  # seconds between status checks of an asynchronous Polly speech synthesis task
+TASK_MIN_ITEMS = 20  # fewer items than this are synthesized directly, since tasks have more per-item latency
+TASK_LIST_PAGE_SIZE = 100  # max speech synthesis tasks per list_speech_synthesis_tasks response
+
+
+def _call_with_backoff(func: Callable[..., Any], **kwargs: Any) -> Any:  # noqa: ANN401
+    """Call an AWS client method, retrying with exponential backoff and jitter while it's throttled.
+
+    The client's adaptive retry mode handles most throttling. This keeps a long run going if requests
+    are still throttled after those retries, instead of failing the whole run on one item.
+
+    Args:
+        func (Callable): the client method, e.g. polly_client.synthesize_speech
+        **kwargs: arguments for func
+
+    Returns:
+        (Any): the return value of func
+
+    Raises:
+        ClientError: If the request fails for another reason, or is still throttled after THROTTLE_RETRIES.
+
+    """
+    for attempt in range(THROTTLE_RETRIES):
+        try:
+            return func(**kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in THROTTLING_ERROR_CODES:
+                raise
+            delay: float = min(THROTTLE_BACKOFF_BASE * 2**attempt + random.random(), THROTTLE_BACKOFF_MAX)  # noqa: S311
+            logger.warning("AWS request throttled, retrying in %.1fs", delay)
+            time.sleep(delay)
+    return func(**kwargs)
+
+
+def _start_speech_synthesis_task(
+    polly_client: PollyClient,
+    s3_bucket: str,
+    synth_speech_kwargs: dict[str, str | VoiceIdType | LanguageCodeType | EngineType | OutputFormatType],
+    rate_limiter: ttsutil.RateLimiter | None = None,
+) -> dict[str, Any]:
+    """Start an asynchronous AWS Polly speech synthesis task that writes its output to S3.
+
+    Tasks run on Polly's task fleet rather than holding a synthesize_speech request open, and are not
+    limited to synthesize_speech's text length.
+
+    Args:
+        polly_client (PollyClient): Boto3 Polly client object, shared between threads
+        s3_bucket (str): S3 bucket for Polly to write the task output to
+        synth_speech_kwargs (dict): the same arguments as for synthesize_speech
+        rate_limiter (ttsutil.RateLimiter | None): limits Polly requests, shared between threads.
+            Defaults to None, no limit.
+
+    Returns:
+        (dict[str, Any]): the started SynthesisTask
+
+    Raises:
+        BotoCoreError: If the AWS request fails.
+        ClientError: If the AWS request is rejected, e.g. InvalidSsmlException.
+
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    return _call_with_backoff(
+        polly_client.start_speech_synthesis_task, OutputS3BucketName=s3_bucket, **synth_speech_kwargs
+    )["SynthesisTask"]
+
+
+def _get_speech_synthesis_task(polly_client: PollyClient, task_id: str) -> dict[str, Any]:
+    """Get the current state of an AWS Polly speech synthesis task.
+
+    Args:
+        polly_client (PollyClient): Boto3 Polly client object, shared between threads
+        task_id (str): the task's TaskId
+
+    Returns:
+        (dict[str, Any]): the SynthesisTask
+
+    Raises:
+        BotoCoreError: If the AWS request fails.
+        ClientError: If the AWS request is rejected.
+
+    """
+    return _call_with_backoff(polly_client.get_speech_synthesis_task, TaskId=task_id)["SynthesisTask"]
+
+
+def _list_unfinished_task_ids(polly_client: PollyClient) -> set[str]:
+    """Get the TaskIds of every scheduled or in progress AWS Polly speech synthesis task of the account.
+
+    A few paginated list requests cover every task, instead of a get request per task that would be throttled
+    on large runs.
+
+    Args:
+        polly_client (PollyClient): Boto3 Polly client object
+
+    Returns:
+        (set[str]): TaskIds of the unfinished tasks, in the client's region
+
+    Raises:
+        BotoCoreError: If an AWS request fails.
+        ClientError: If an AWS request is rejected.
+
+    """
+    task_ids: set[str] = set()
+    for status in ("scheduled", "inProgress"):
+        list_kwargs: dict[str, Any] = {"Status": status, "MaxResults": TASK_LIST_PAGE_SIZE}
+        while True:
+            response: dict[str, Any] = _call_with_backoff(polly_client.list_speech_synthesis_tasks, **list_kwargs)
+            task_ids.update(synthesis_task["TaskId"] for synthesis_task in response["SynthesisTasks"])
+            if not response.get("NextToken"):
+                break
+            list_kwargs["NextToken"] = response["NextToken"]
+    return task_ids
+
+
+def _task_output_key(synthesis_task: dict[str, Any]) -> str:
+    """Get the S3 key of an AWS Polly speech synthesis task's output.
+
+    Args:
+        synthesis_task (dict[str, Any]): the SynthesisTask
+
+    Returns:
+        (str): the S3 object key
+
+    """
+    # OutputUri is https://s3.<region>.amazonaws.com/<bucket>/<key>
+    return unquote(urlparse(synthesis_task["OutputUri"]).path.split("/", 2)[2])
+
+
+def _log_task_outputs(s3_bucket: str, synthesis_tasks: list[dict[str, Any]]) -> None:
+    """Log started AWS Polly speech synthesis tasks whose output may be left in S3, so it can be cleaned up.
+
+    Args:
+        s3_bucket (str): S3 bucket the tasks write their output to
+        synthesis_tasks (list[dict[str, Any]]): the started SynthesisTasks whose output was not downloaded.
+            Failed tasks have no output, and are left out.
+
+    """
+    synthesis_tasks = [synthesis_task for synthesis_task in synthesis_tasks if synthesis_task["TaskStatus"] != "failed"]
+    if not synthesis_tasks:
+        return
+    logger.warning(
+        "Stopped with %d started AWS Polly speech synthesis task(s) not downloaded. Their output may be left "
+        "in S3 bucket %s, delete it there once they finish:",
+        len(synthesis_tasks),
+        s3_bucket,
+    )
+    for synthesis_task in synthesis_tasks:
+        logger.warning("TaskId %s, key %s", synthesis_task["TaskId"], _task_output_key(synthesis_task))
+
+
+def _download_task_output(s3_client: BaseClient, s3_bucket: str, synthesis_task: dict[str, Any]) -> bytes:
+    """Download the output of a completed AWS Polly speech synthesis task from S3, then delete it there.
+
+    Args:
+        s3_client (BaseClient): Boto3 S3 client object, shared between threads
+        s3_bucket (str): S3 bucket the task wrote its output to
+        synthesis_task (dict[str, Any]): the completed SynthesisTask
+
+    Returns:
+        (bytes): the synthesized audio
+
+    Raises:
+        BotoCoreError: If an AWS request fails.
+        ClientError: If an AWS request is rejected.
+
+    """
+    s3_key: str = _task_output_key(synthesis_task)
+    s3_object = s3_client.get_object(Bucket=s3_bucket, Key=s3_key)
+    with closing(s3_object["Body"]) as body:
+        audio_bytes: bytes = body.read()
+    s3_client.delete_object(Bucket=s3_bucket, Key=s3_key)
+    return audio_bytes
+
+
+def _run_speech_synthesis_tasks(
+    executor: ThreadPoolExecutor,
+    polly_client: PollyClient,
+    s3_bucket: str,
+    unique_texts: dict[tuple[str, str], list[tuple[dict[str, str], Path]]],
+    synth_speech_kwargs: Callable[[dict[str, str]], dict[str, Any]],
+    rate_limiter: ttsutil.RateLimiter | None = None,
+    cancel_event: threading.Event | None = None,
+) -> dict[tuple[str, str], dict[str, Any]] | None:
+    """Start an asynchronous Polly speech synthesis task for every text, then wait until all have finished.
+
+    Every task is started before any is polled, so they all run on Polly's task fleet at the same time,
+    instead of each worker thread waiting on one task at a time. Starting tasks uses the worker pool. Their
+    status is polled in bulk with list_speech_synthesis_tasks, and each task is only fetched once it has
+    finished. The finished tasks' output is downloaded afterwards by _process_item().
+
+    If this stops early, queued task starts are cancelled, and every started task is logged with its output
+    key, since its output is left in S3.
+
+    Args:
+        executor (ThreadPoolExecutor): the run's worker pool
+        polly_client (PollyClient): Boto3 Polly client object, shared between threads
+        s3_bucket (str): S3 bucket for Polly to write the task output to
+        unique_texts (dict): text key -> (item, file path) of each file with that text. Texts whose task
+            is rejected, e.g. for invalid SSML, are logged and removed from it.
+        synth_speech_kwargs (Callable[[dict[str, str]], dict[str, Any]]): gets the synthesize_speech
+            arguments of a template item
+        rate_limiter (ttsutil.RateLimiter | None): limits starting tasks, shared between threads.
+            Defaults to None, no limit.
+        cancel_event (threading.Event | None): checked as each task starts and between polls, set to stop.
+            Defaults to None, not cancellable.
+
+    Returns:
+        (dict[tuple[str, str], dict[str, Any]] | None): text key -> finished SynthesisTask, completed or
+            failed. None on an AWS error that should stop processing, which is already logged, or if cancelled.
+
+    """
+    start_futures: dict[Future[dict[str, Any]], tuple[str, str]] = {
+        executor.submit(
+            _start_speech_synthesis_task, polly_client, s3_bucket, synth_speech_kwargs(same_text[0][0]), rate_limiter
+        ): text_key
+        for text_key, same_text in unique_texts.items()
+    }
+    tasks: dict[tuple[str, str], dict[str, Any]] = {}
+
+    def stop() -> None:
+        # wait for starts already sent, so every started task is logged
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future, text_key in start_futures.items():
+            if text_key not in tasks and not future.cancelled() and future.exception() is None:
+                tasks[text_key] = future.result()
+        _log_task_outputs(s3_bucket, list(tasks.values()))
+
+    try:
+        for future in as_completed(start_futures):
+            text_key: tuple[str, str] = start_futures[future]
+            try:
+                tasks[text_key] = future.result()
+            # if SSML is invalid or too long, log and continue with the next item
+            except (
+                polly_client.exceptions.InvalidSsmlException,
+                polly_client.exceptions.TextLengthExceededException,
+            ):
+                logger.exception(
+                    "AWS Polly rejected the speech synthesis task of template item %s", unique_texts[text_key][0][0]
+                )
+                del unique_texts[text_key]
+            except (BotoCoreError, ClientError):
+                logger.exception("AWS Polly start_speech_synthesis_task failed")
+                stop()
+                return None
+            if cancel_event is not None and cancel_event.is_set():
+                logger.warning("Cancelled while starting AWS Polly speech synthesis tasks")
+                stop()
+                return None
+        logger.info("Started %d AWS Polly speech synthesis tasks, waiting for them to finish", len(tasks))
+
+        unfinished: dict[str, tuple[str, str]] = {
+            synthesis_task["TaskId"]: text_key for text_key, synthesis_task in tasks.items()
+        }
+        while unfinished:
+            time.sleep(TASK_POLL_INTERVAL)
+            if cancel_event is not None and cancel_event.is_set():
+                logger.warning("Cancelled while waiting for AWS Polly speech synthesis tasks")
+                stop()
+                return None
+            try:
+                running: set[str] = _list_unfinished_task_ids(polly_client)
+                finished: list[dict[str, Any]] = list(
+                    executor.map(
+                        partial(_get_speech_synthesis_task, polly_client),
+                        [task_id for task_id in unfinished if task_id not in running],
+                    )
+                )
+            except (BotoCoreError, ClientError):
+                logger.exception("AWS Polly failed to get the status of speech synthesis tasks")
+                stop()
+                return None
+            for synthesis_task in finished:
+                # a task that was just started may not be listed yet
+                if synthesis_task["TaskStatus"] not in ("scheduled", "inProgress"):
+                    tasks[unfinished.pop(synthesis_task["TaskId"])] = synthesis_task
+            logger.debug("%d/%d AWS Polly speech synthesis tasks finished", len(tasks) - len(unfinished), len(tasks))
+    except BaseException:
+        stop()
+        raise
+    return tasks
+
+
+def _write_file(file_fullpath: Path, data: bytes) -> None:
+    """Write bytes to a file with low-level os.write calls, without a buffered file object.
+
+    The whole file is usually written by a single os.write call.
+
+    Args:
+        file_fullpath (Path): the file to create, overwritten if it exists
+        data (bytes): the file contents
+
+    Raises:
+        OSError: If the file could not be written.
+
+    """
+    fd: int = os.open(file_fullpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
+
+
+def _cache_key(
+    voiceid: str,
+    engine: str,
+    languagecode: str | None,
+    outputformat: str,
+    text: str,
+    texttype: str,
+    *,
+    reencode: bool,
+) -> str:
+    """Get the cache key of an output file, a hash of everything that affects its content.
+
+    Args:
+        voiceid (str): AWS Polly voice ID
+        engine (str): AWS Polly engine
+        languagecode (str | None): AWS Polly language code, or None for the voice's default
+        outputformat (str): AWS Polly output format
+        text (str): the text to synthesize
+        texttype (str): "text" or "ssml"
+        reencode (bool): whether the output is normalized and re-encoded with ffmpeg
+
+    Returns:
+        (str): hex sha256 digest
+
+    """
+    key: str = "|".join((voiceid, engine, languagecode or "", outputformat, str(reencode), texttype, text))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _split_text(text: str, max_chars: int = MAX_TEXT_CHARS) -> list[str]:
+    """Split plain text into chunks of at most max_chars characters, at sentence boundaries where possible.
+
+    Sentences longer than max_chars are split between words, and words longer than max_chars are split anywhere.
+
+    Args:
+        text (str): the plain text to split
+        max_chars (int, optional): max length of each chunk. Defaults to MAX_TEXT_CHARS.
+
+    Returns:
+        (list[str]): the chunks, in order. Just [text] if it isn't longer than max_chars.
+
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces: list[str] = []
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for word in sentence.split():
+            pieces.extend(word[i : i + max_chars] for i in range(0, len(word), max_chars))
+
+    # pack as many whole pieces into each chunk as fit
+    chunks: list[str] = []
+    chunk: str = ""
+    for piece in pieces:
+        if chunk and len(chunk) + 1 + len(piece) > max_chars:
+            chunks.append(chunk)
+            chunk = piece
+        else:
+            chunk = f"{chunk} {piece}" if chunk else piece
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _synth_speech_kwargs(
+    item: dict[str, str],
+    voiceid: VoiceIdType,
+    languagecode: LanguageCodeType | None,
+    engine: EngineType,
+    outputformat: OutputFormatType,
+) -> dict[str, str | VoiceIdType | LanguageCodeType | EngineType | OutputFormatType]:
+    """Build the synthesize_speech arguments of a template item, also used for speech synthesis tasks.
+
+    Args:
+        item (dict[str, str]): the template item
+        voiceid (VoiceIdType): AWS Polly voice ID to use
+        languagecode (LanguageCodeType | None): AWS Polly language code to use, or None for the voice's default
+        engine (EngineType): AWS Polly engine to use
+        outputformat (OutputFormatType): AWS Polly output format to use
+
+    Returns:
+        (dict): keyword arguments for synthesize_speech
+
+    """
+    # if SSML text exists, set texttype to ssml and use ssml text instead of plain tts text
+    synth_speech_kwargs: dict[str, str | VoiceIdType | LanguageCodeType | EngineType | OutputFormatType] = {
+        "Text": item["ssml_text"] or item["tts_text"],
+        "VoiceId": voiceid,
+        "TextType": "ssml" if item["ssml_text"] else "text",
+        "Engine": engine,
+        "OutputFormat": outputformat,
+    }
+    # if languagecode is omitted, AWS Polly will use the default for the voice
+    if languagecode:
+        synth_speech_kwargs["LanguageCode"] = languagecode
+    return synth_speech_kwargs
+
+
+def _synthesize(
+    polly_client: PollyClient,
+    synth_speech_kwargs: dict[str, Any],
+    ffmpeg_input_ext: str,
+    rate_limiter: ttsutil.RateLimiter | None = None,
+    *,
+    reencode: bool = True,
+) -> bytes | None:
+    """Synthesize one piece of text with AWS Polly, and decode compressed audio to WAV for re-encoding.
+
+    Args:
+        polly_client (PollyClient): Boto3 Polly client object, shared between threads
+        synth_speech_kwargs (dict[str, Any]): keyword arguments for synthesize_speech
+        ffmpeg_input_ext (str): file extension matching the output format, e.g. ".mp3"
+        rate_limiter (ttsutil.RateLimiter | None): limits Polly synthesis requests, shared between threads.
+            Defaults to None, no limit.
+        reencode (bool): if False, return Polly's audio as is. Defaults to True.
+
+    Returns:
+        (bytes | None): raw PCM audio for output format pcm, WAV audio if re-encoding compressed audio,
+            otherwise Polly's audio as is. None on error, which is already logged.
+
+    Raises:
+        BotoCoreError: If the AWS request fails.
+        ClientError: If AWS Polly returns an error, including polly_client.exceptions.
+        FFMpegExecuteError: If decoding the audio fails.
+
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+
+    response: SynthesizeSpeechOutputTypeDef = _call_with_backoff(polly_client.synthesize_speech, **synth_speech_kwargs)
+    if "AudioStream" not in response:
+        logger.error("Error: No AudioStream in AWS Polly response")
+        return None
+
+    # use closing to ensure that the close method of the stream is called after the with finishes
+    with closing(response["AudioStream"]) as stream:
+        if ffmpeg_input_ext == ".pcm" or not reencode:
+            return stream.read()
+        # decode while the audio is still being received, instead of after the whole response
+        return ttsutil.decode_stream_to_wav(stream)
+
+
+def _process_item(
+    item: dict[str, str],
+    file_fullpath: Path,
+    polly_client: PollyClient,
+    voiceid: VoiceIdType,
+    languagecode: LanguageCodeType | None,
+    engine: EngineType,
+    outputformat: OutputFormatType,
+    ffmpeg_input_ext: str,
+    s3_client: BaseClient | None = None,
+    s3_bucket: str | None = None,
+    rate_limiter: ttsutil.RateLimiter | None = None,
+    *,
+    synthesis_task: dict[str, Any] | None = None,
+    reencode: bool = True,
+) -> int:
+    """Create a single TTS file for a template item with AWS Polly, then normalize its volume with ffmpeg.
+
+    Run in worker threads, so it only touches its own item and output file. The output directory must exist.
+
+    Args:
+        item (dict[str, str]): the template item
+        file_fullpath (Path): the TTS file to create
+        polly_client (PollyClient): Boto3 Polly client object, shared between threads
+        voiceid (VoiceIdType): AWS Polly voice ID to use
+        languagecode (LanguageCodeType | None): AWS Polly language code to use, or None for the voice's default
+        engine (EngineType): AWS Polly engine to use
+        outputformat (OutputFormatType): AWS Polly output format to use
+        ffmpeg_input_ext (str): file extension matching outputformat, e.g. ".mp3"
+        s3_client (BaseClient | None): Boto3 S3 client object, required if synthesis_task is set.
+            Defaults to None.
+        s3_bucket (str | None): S3 bucket synthesis_task wrote its output to, required if synthesis_task
+            is set. Defaults to None.
+        rate_limiter (ttsutil.RateLimiter | None): limits Polly synthesis requests, shared between threads.
+            Defaults to None, no limit.
+        synthesis_task (dict[str, Any] | None): the item's finished asynchronous speech synthesis task, see
+            _run_speech_synthesis_tasks(). Its output is downloaded from S3 instead of calling
+            synthesize_speech. Defaults to None.
+        reencode (bool): if False, write Polly's audio to the output file as is, without volume
+            normalization or re-encoding. Defaults to True.
+
+    Returns:
+        (int): 0 on success, 1 on error that should stop processing, 2 if the item was skipped due to invalid SSML,
+            text that's too long, or a failed synthesis task
+
+    """
+    synth_speech_kwargs: dict[str, str | VoiceIdType | LanguageCodeType | EngineType | OutputFormatType] = (
+        _synth_speech_kwargs(item, voiceid, languagecode, engine, outputformat)
+    )
+    tts_text: str = synth_speech_kwargs["Text"]
+    texttype: str = synth_speech_kwargs["TextType"]
+
+    if synthesis_task is not None and synthesis_task["TaskStatus"] != "completed":
+        logger.error(
+            "AWS Polly speech synthesis task %s failed for template item %s: %s",
+            synthesis_task["TaskId"],
+            item,
+            synthesis_task.get("TaskStatusReason"),
+        )
+        return 2
+
+    clips: list[bytes] = []
+    try:
+        if synthesis_task is not None:
+            # Asynchronous tasks accept much longer text, so their output is always a single clip.
+            clip: bytes = _download_task_output(s3_client, s3_bucket, synthesis_task)  # type: ignore[arg-type]
+            clips.append(ttsutil.decode_to_wav(clip) if reencode and ffmpeg_input_ext != ".pcm" else clip)
+        else:
+            # Long plain text is synthesized in chunks, which are joined below.
+            # SSML can't be split without breaking its markup, see the except below.
+            for text in _split_text(tts_text) if texttype == "text" else [tts_text]:
+                synthesized: bytes | None = _synthesize(
+                    polly_client,
+                    {**synth_speech_kwargs, "Text": text},
+                    ffmpeg_input_ext,
+                    rate_limiter,
+                    reencode=reencode,
+                )
+                if synthesized is None:
+                    return 1
+                clips.append(synthesized)
+    # if SSML is invalid, log and continue with next item
+    except polly_client.exceptions.InvalidSsmlException:
+        logger.exception("Invalid SSML for template item: %s", item)
+        return 2
+    except polly_client.exceptions.TextLengthExceededException:
+        logger.exception("Text too long for AWS Polly, shorten it or split it into several items: %s", item)
+        return 2
+    except (BotoCoreError, ClientError):
+        logger.exception(
+            "AWS Polly synthesize_speech failed for template item %s; call: synthesize_speech(text, %s, %s, %s, %s)",
+            item,
+            voiceid,
+            texttype,
+            engine,
+            outputformat,
+        )
+        return 1
+    except FFMpegExecuteError:
+        logger.exception("Error decoding audio with ffmpeg")
+        return 1
+
+    if len(clips) == 1:
+        audio_bytes: bytes = clips[0]
+    else:
+        logger.debug("Joining %d chunks of long text for %s", len(clips), file_fullpath)
+        if ffmpeg_input_ext == ".pcm" or not reencode:
+            # raw PCM samples, and mp3 frames, can be joined as is
+            audio_bytes: bytes = b"".join(clips)
+        else:
+            try:
+                audio_bytes: bytes = ttsutil.concat_wav(clips)
+            except ValueError:
+                logger.exception("Error joining audio of long text chunks")
+                return 1
+
+    if not reencode:
+        try:
+            _write_file(file_fullpath, audio_bytes)
+        except OSError:
+            logger.exception("Error writing output file %s", file_fullpath)
+            return 1
+        return 0
+
+    # Get the max db of the audio so we can increase file volume.
+    # The audio is piped to ffmpeg's stdin instead of going through a temporary file.
+    # Compressed audio was decoded to PCM once above, so the peak is found in Python and the same PCM is
+    # encoded below, and it's never decoded twice. PCM output is already raw samples.
+    try:
+        if ffmpeg_input_ext == ".pcm":
+            input_max_volume: float = ttsutil.get_max_volume_pcm(audio_bytes)
+        else:
+            input_max_volume: float = ttsutil.get_max_volume_wav(audio_bytes)
+    except ValueError:
+        logger.exception("Error processing audio")
+        return 1
+
+    # Set ffmpeg input to stdin, raw PCM or the decoded WAV.
+    # ffmpeg will intelligently handle format conversion based on the extension of the output file.
+    # If input is pcm format, we need to specify rate, channels, format for ffmpeg
+    # AWS Polly PCM output is 16000Hz, 1-channel, 16-bit signed little-endian
+    if ffmpeg_input_ext == ".pcm":
+        input_stream: ffmpeg.AudioStream = ffmpeg.input("pipe:0", ar=16000, ac=1, f="s16le")
+    else:
+        input_stream: ffmpeg.AudioStream = ffmpeg.input("pipe:0")
+
+    # TODO: set speech speed to hit a specific total audio duration, instead of guessing?
+    # TODO: Check if selected AWS Polly voice supports SSML? Currently only using SSML voices.
+    # If "prosody rate='fast'" is set in SSML text, simulate that with ffmpeg atempo filter.
+    # AWS Polly SSML rate='fast' is ~150% (1.5) per experiments.
+    # if "rate='fast'" in ssml_text:
+    #    input_stream = input_stream.atempo(tempo=1.3)
+
+    # Files must be as loud as possible to be consistently audible in-game.
+    # If previously determined peak db is less than -0.5db, use ffmpeg volume filter
+    # to increase the file volume by the same amount, resulting in -0.5db peak.
+    # Unfortunately, other ffmpeg filters such as loudnorm or dynaudnorm do not
+    # work well for our purposes, so we have to measure the peak before encoding.
+    if input_max_volume < -0.5:
+        volume_adjustment: float = -input_max_volume - 0.5  # -0.5dB for clipping safety
+        input_stream = input_stream.volume(volume=f"{volume_adjustment}dB")
+
+    # Path of Exile is picky about VBR mp3, and ffmpeg seems to default to VBR output,
+    # so force CBR with ab= (b:a). Add abr=1 option for fun (hybrid CBR/VBR).
+    # Several items are encoded at once, so limit each ffmpeg to ttsutil.FFMPEG_THREADS.
+    output_stream: ffmpeg.dag.nodes.GlobalStream = input_stream.output(
+        filename=file_fullpath, ab="48k", extra_options={"abr": 1, "threads": ttsutil.FFMPEG_THREADS}
+    ).global_args(
+        hide_banner=True,
+        loglevel="error",
+        filter_threads=ttsutil.FFMPEG_THREADS,
+        filter_complex_threads=ttsutil.FFMPEG_THREADS,
+    )
+
+    # Lastly, run ffmpeg.
+    try:
+        output_stream.run(cmd=ttsutil.FFMPEG_BIN, input=audio_bytes, quiet=True)
+    except FFMpegExecuteError:
+        logger.exception("ffmpeg failed when writing output file %s", file_fullpath)
+        return 1
+
+    return 0
+
+
+def describe_voice_ids(polly_client: PollyClient, **kwargs: Any) -> set[str] | None:  # noqa: ANN401
+    """Call describe_voices, which also resolves the client's credentials and opens its first connection.
+
+    Only synthesizing needs IAM rights, so a profile that isn't allowed polly:DescribeVoices still works.
+    That's logged as a warning and None is returned, instead of failing the run.
+
+    Args:
+        polly_client (PollyClient): Boto3 Polly client object
+        **kwargs: arguments for describe_voices, e.g. Engine
+
+    Returns:
+        (set[str] | None): IDs of the voices, or None if the AWS profile isn't allowed to list them
+
+    Raises:
+        BotoCoreError: If the AWS request fails, e.g. with missing credentials or no connection.
+        ClientError: If the AWS request is rejected for any other reason than access denied.
+
+    """
+    try:
+        voices: DescribeVoicesOutputTypeDef = polly_client.describe_voices(**kwargs)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "AccessDeniedException":
+            raise
+        logger.warning("AWS profile isn't allowed polly:DescribeVoices, skipping the credentials and voice check")
+        return None
+    return {voice["Id"] for voice in voices["Voices"]}
+
 
 def ttsfromtemplate_awspolly(
     polly_client: PollyClient,
@@ -62,11 +754,22 @@ def ttsfromtemplate_awspolly(
     languagecode: LanguageCodeType | None = None,
     engine: EngineType = "standard",
     outputformat: OutputFormatType = "mp3",
+    max_workers: int = DEFAULT_WORKERS,
+    s3_client: BaseClient | None = None,
+    s3_bucket: str | None = None,
+    *,
+    reencode: bool = True,
+    cache_dir: Path | None = None,
+    max_rate: float | None = None,
+    cancel_event: threading.Event | None = None,
 ) -> int:
     """Create a soundpack set of TTS mp3 files from a template json file, using AWS Polly.
 
+    Polly requests are network bound, so template items are processed by a pool of worker threads.
+
     Args:
-        polly_client (PollyClient): Boto3 Polly client object
+        polly_client (PollyClient): Boto3 Polly client object, shared by all worker threads. Create it with
+            POLLY_CLIENT_CONFIG or another config with max_pool_connections of at least max_workers.
         voiceid (VoiceIdType): AWS Polly voice ID to use, e.g. "Brian"
         template_file (Path, optional): the name of the input json template file. Defaults to "template.json".
         output_dir (Path, optional): the output directory containing a 'sounds' subdirectory to
@@ -74,23 +777,38 @@ def ttsfromtemplate_awspolly(
         languagecode (LanguageCodeType | None, optional): AWS Polly language code to use. Defaults to None.
         engine (EngineType, optional): AWS Polly engine to use. Defaults to "standard".
         outputformat (OutputFormatType, optional): AWS Polly output format to use. Defaults to "mp3".
+        max_workers (int, optional): number of template items to process at once. Defaults to DEFAULT_WORKERS.
+        s3_client (BaseClient | None, optional): Boto3 S3 client object, required if s3_bucket is set.
+            Defaults to None.
+        s3_bucket (str | None, optional): if set, use asynchronous Polly speech synthesis tasks that write
+            their output to this S3 bucket, instead of synthesize_speech. All tasks are started and finished
+            before their output is downloaded. Ignored if fewer than TASK_MIN_ITEMS items need to be
+            synthesized. Defaults to None.
+        reencode (bool, optional): if False, write Polly's mp3 output files as is, skipping ffmpeg volume
+            normalization and CBR re-encoding. Only for outputformat "mp3". Defaults to True.
+        cache_dir (Path | None, optional): directory of output files from earlier runs, keyed by a hash of
+            their voice, engine, text, etc. Items found there are copied instead of synthesized, and newly
+            synthesized files are added to it. Defaults to None, no cache.
+        max_rate (float | None, optional): max Polly synthesis requests per second, to stay under the
+            account's transactions per second quota for the engine. Defaults to None, limited only by
+            max_workers and the client's adaptive retries.
+        cancel_event (threading.Event | None, optional): set from another thread to stop the run, see
+            ttsutil.make_unique_texts(). Defaults to None, not cancellable.
 
     Returns:
-        (int): 0 on success, 1 on error
+        (int): 0 on success, 1 on error or if cancelled
 
     """
     template_file = template_file or Path("template.json")
     output_dir = output_dir or Path.cwd()
 
-    if outputformat == "mp3":
-        ffmpeg_input_ext: str = ".mp3"
-    elif outputformat == "ogg_vorbis":
-        ffmpeg_input_ext: str = ".ogg"
-    elif outputformat == "pcm":
-        ffmpeg_input_ext: str = ".pcm"
-    else:
+    ffmpeg_input_ext: str | None = OUTPUT_FORMAT_EXTENSIONS.get(outputformat)
+    if ffmpeg_input_ext is None:
         logger.error("Error: Invalid Polly output format '%s'", outputformat)
         return 1
+    if not reencode and outputformat != "mp3":
+        logger.error("Error: Skipping re-encoding requires Polly output format 'mp3', not '%s'", outputformat)
+        return 1
 
     sounds_dir: Path = output_dir / "sounds"
 
@@ -104,147 +822,131 @@ def ttsfromtemplate_awspolly(
         logger.error("Error: required output subdirectory '%s' does not exist.", sounds_dir)
         return 1
 
-    with Path.open(template_file, encoding="utf-8") as f:
-        try:
-            template_data: list[dict[str, str]] = json.load(f)
-        except (JSONDecodeError, UnicodeDecodeError):
-            logger.exception("Error reading template file %s", template_file)
-            return 1
+    try:
+        template_data: list[dict[str, str]] = ttsutil.load_template(template_file)
+    except (OSError, JSONDecodeError, UnicodeDecodeError):
+        logger.exception("Error reading template file %s", template_file)
+        return 1
 
+    # skip template entries that already exist as files before submitting any work
+    pending: list[tuple[dict[str, str], Path]] = ttsutil.find_pending(template_data, sounds_dir)
+    skipped_count: int = len(template_data) - len(pending)
     created_count: int = 0
-    skipped_count: int = 0
 
-    # for each template entry that doesn't already exist as a file, call AWS Polly to create
-    # the TTS audio object, then output the returned object to the specified file
-    for item in template_data:
-        file_partialpath: Path = Path(item["path"])
-        tts_text: str = item["tts_text"]
-        ssml_text: str = item["ssml_text"]
-
-        file_fullpath: Path = sounds_dir / file_partialpath
-        # skip if file already exists
-        if file_fullpath.exists():
-            skipped_count += 1
-            continue
-
-        # need to create output directory (and intermediates) if they don't exist
-        if not file_fullpath.parent.exists():
-            file_fullpath.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+    try:
+        ttsutil.make_parent_dirs(file_fullpath for _, file_fullpath in pending)
+    except OSError:
+        logger.exception("Error creating output directories")
+        return 1
 
-        # if SSML text exists, set texttype to ssml and use ssml text instead of plain tts text
-        if ssml_text:
-            texttype: str = "ssml"
-            tts_text: str = ssml_text
-        else:
-            texttype: str = "text"
-
-        # build a kwargs dict for the synthesize_speech call, since languagecode is optional
-        synth_speech_kwargs: dict[str, str | VoiceIdType | LanguageCodeType | EngineType | OutputFormatType] = {
-            "Text": tts_text,
-            "VoiceId": voiceid,
-            "TextType": texttype,
-            "Engine": engine,
-            "OutputFormat": outputformat,
-        }
-        # if languagecode is omitted, AWS Polly will use the default for the voice
-        if languagecode:
-            synth_speech_kwargs["LanguageCode"] = languagecode
+    # Items with the same text and text type produce the same audio, since voice, engine, etc. are the
+    # same for the whole run. Only synthesize the first of each, then link or copy its output file to the rest.
+    unique_texts: dict[tuple[str, str], list[tuple[dict[str, str], Path]]] = ttsutil.group_by_text(
+        pending, lambda item: (item["ssml_text"], "ssml") if item["ssml_text"] else (item["tts_text"], "text")
+    )
 
+    cache_paths: dict[tuple[str, str], Path] = {}
+    if cache_dir is not None:
         try:
-            response: SynthesizeSpeechOutputTypeDef = polly_client.synthesize_speech(**synth_speech_kwargs)  # type: ignore
-        # if SSML is invalid, log and continue with next item
-        except polly_client.exceptions.InvalidSsmlException:
-            logger.exception("Invalid SSML for template item: %s", item)
-            continue
-        except (BotoCoreError, ClientError):
-            logger.exception(
-                "AWS Polly synthesize_speech failed for template item %s; call: synthesize_speech(text, %s, %s, %s, %s)",
-                item,
-                voiceid,
-                texttype,
-                engine,
-                outputformat,
+            cache_paths, created_count = ttsutil.copy_cached(
+                unique_texts,
+                cache_dir,
+                lambda text_key: _cache_key(
+                    voiceid, engine, languagecode, outputformat, text_key[0], text_key[1], reencode=reencode
+                ),
             )
+        except OSError:
+            logger.exception("Error copying cached files from %s", cache_dir)
             return 1
+        if created_count:
+            logger.info("Copied %d file(s) from cache %s", created_count, cache_dir)
 
-        if "AudioStream" not in response:
-            logger.error("Error: No AudioStream in AWS Polly response")
-            return 1
+    # suppress ffmpeg INFO log messages
+    logging.getLogger("ffmpeg").setLevel(logging.WARNING)
 
-        # use closing to ensure that the close method of the stream is called after the with finishes
-        with closing(response["AudioStream"]) as stream:
-            try:
-                # Write the stream to a temporary file so we can postprocess it with ffmpeg.
-                # delete=False so we don't have to worry about staying in the with context
-                with tempfile.NamedTemporaryFile(suffix=(ffmpeg_input_ext), delete=False) as f:
-                    f.write(stream.read())
-            except OSError:
-                logger.exception("Error writing temporary audio file")
-                return 1
+    if s3_bucket and len(unique_texts) < TASK_MIN_ITEMS:
+        logger.info("Only %d items to synthesize, using synthesize_speech instead of S3 tasks", len(unique_texts))
+        s3_bucket = None
 
-        # suppress ffmpeg INFO log messages
-        logging.getLogger("ffmpeg").setLevel(logging.WARNING)
-
-        # Get the max db of the audio file with ffmpeg volumedetect so we can increase file volume.
-        try:
-            input_max_volume: float = ttsutil.get_max_volume(f.name)
-        except (FFMpegExecuteError, ValueError):
-            logger.exception("Error processing audio with ffmpeg")
-            Path(f.name).unlink(missing_ok=True)  # cleanup temp file if exiting early
-            return 1
+    rate_limiter: ttsutil.RateLimiter | None = ttsutil.RateLimiter(max_rate) if max_rate else None
+    process_item = partial(
+        _process_item,
+        polly_client=polly_client,
+        voiceid=voiceid,
+        languagecode=languagecode,
+        engine=engine,
+        outputformat=outputformat,
+        ffmpeg_input_ext=ffmpeg_input_ext,
+        s3_client=s3_client,
+        s3_bucket=s3_bucket,
+        rate_limiter=rate_limiter,
+        reencode=reencode,
+    )
 
-        # Set ffmpeg input to the the temp file.
-        # ffmpeg will intelligently handle format conversion based on the extension of the output file.
-        # If input is pcm format, we need to specify rate, channels, format for ffmpeg
-        # AWS Polly PCM output is 16000Hz, 1-channel, 16-bit signed little-endian
-        if ffmpeg_input_ext == ".pcm":
-            input_stream: ffmpeg.AudioStream = ffmpeg.input(f.name, ar=16000, ac=1, f="s16le")
-        else:
-            input_stream: ffmpeg.AudioStream = ffmpeg.input(f.name)
-
-        # TODO: set speech speed to hit a specific total audio duration, instead of guessing?
-        # TODO: Check if selected AWS Polly voice supports SSML? Currently only using SSML voices.
-        # If "prosody rate='fast'" is set in SSML text, simulate that with ffmpeg atempo filter.
-        # AWS Polly SSML rate='fast' is ~150% (1.5) per experiments.
-        # if "rate='fast'" in ssml_text:
-        #    input_stream = input_stream.atempo(tempo=1.3)
-
-        # Files must be as loud as possible to be consistently audible in-game.
-        # If previously determined peak db is less than -0.5db, use ffmpeg volume filter
-        # to increase the file volume by the same amount, resulting in -0.5db peak.
-        # Unfortunately, other ffmpeg filters such as loudnorm or dynaudnorm do not
-        # work well for our purposes, so we have to do this two-pass method.
-        if input_max_volume < -0.5:
-            volume_adjustment: float = -input_max_volume - 0.5  # -0.5dB for clipping safety
-            input_stream = input_stream.volume(volume=f"{volume_adjustment}dB")
-
-        # Path of Exile is picky about VBR mp3, and ffmpeg seems to default to VBR output,
-        # so force CBR with ab= (b:a). Add abr=1 option for fun (hybrid CBR/VBR).
-        output_stream: ffmpeg.dag.OutputStream = input_stream.output(
-            filename=file_fullpath, ab="48k", extra_options={"abr": 1}
+    # for each template entry that doesn't already exist as a file, call AWS Polly to create
+    # the TTS audio object, then output the returned object to the specified file.
+    # boto3 clients are thread safe, so all workers share the one client and its connection pool,
+    # instead of a client per thread that would each open their own connections.
+    if polly_client.meta.config.max_pool_connections < max_workers:
+        logger.warning(
+            "Polly client max_pool_connections (%d) is less than workers (%d), extra workers will wait for "
+            "a connection. Use ttsfromtemplate_awspolly.POLLY_CLIENT_CONFIG when creating the client.",
+            polly_client.meta.config.max_pool_connections,
+            max_workers,
         )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # With S3, every task is started and finished first, then the workers below only download,
+        # normalize and encode their output.
+        synthesis_tasks: dict[tuple[str, str], dict[str, Any]] = {}
+        if s3_bucket:
+            tasks: dict[tuple[str, str], dict[str, Any]] | None = _run_speech_synthesis_tasks(
+                executor,
+                polly_client,
+                s3_bucket,
+                unique_texts,
+                partial(
+                    _synth_speech_kwargs,
+                    voiceid=voiceid,
+                    languagecode=languagecode,
+                    engine=engine,
+                    outputformat=outputformat,
+                ),
+                rate_limiter,
+                cancel_event,
+            )
+            if tasks is None:
+                return 1
+            synthesis_tasks = tasks
 
-        # Lastly, run ffmpeg.
+        copied_count: int = created_count
+        retcode: int = 1
         try:
-            output_stream.run(quiet=True)
-        except FFMpegExecuteError:
-            logger.exception("ffmpeg failed when writing output file %s", file_fullpath)
-            Path(f.name).unlink(missing_ok=True)  # cleanup temp file if exiting early
+            retcode, made_count = ttsutil.make_unique_texts(
+                executor,
+                unique_texts,
+                lambda text_key, item, file_fullpath: process_item(
+                    item, file_fullpath, synthesis_task=synthesis_tasks.get(text_key)
+                ),
+                cache_paths,
+                lambda made: logger.info("Created %d/%d files", copied_count + made, len(pending)),
+                PROGRESS_INTERVAL,
+                cancel_event,
+            )
+        finally:
+            if retcode != 0 and synthesis_tasks:
+                # a task's output is deleted from S3 when it's downloaded, so only tasks without a file may be left
+                _log_task_outputs(
+                    str(s3_bucket),
+                    [
+                        synthesis_task
+                        for text_key, synthesis_task in synthesis_tasks.items()
+                        if text_key in unique_texts and not unique_texts[text_key][0][1].exists()
+                    ],
+                )
+        created_count += made_count
+        if retcode != 0:
             return 1
 
-        # cleanup temporary file
-        Path(f.name).unlink(missing_ok=True)
-
-        created_count += 1
-        # if created_count > 1:
-        #     print("\033[1A", end="\x1b[2K")
-        logger.info(
-            "Created file %d/~%d: %s",
-            created_count,
-            (len(template_data) - created_count - skipped_count + 1),
-            file_fullpath,
-        )
-
     logger.info(
         "Successfully finished. %d file(s) created and %d existing file(s) skipped. %d total.",
         created_count,
@@ -282,17 +984,55 @@ def main() -> int:
         "-of",
         "--outputformat",
         help="AWS Polly output format to use",
-        choices=get_args(OutputFormatType),
+        choices=OUTPUT_FORMAT_EXTENSIONS.keys(),
         default="mp3",
     )
     parser.add_argument(
-        "-l",
+        "--s3-bucket",
+        help="use asynchronous Polly speech synthesis tasks that write to this S3 bucket, instead of synthesize_speech",
+        default=None,
+    )
+    parser.add_argument(
+        "--no-reencode",
+        help="write Polly's mp3 output as is, without volume normalization or re-encoding to CBR with ffmpeg",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory of output files cached by content, reused instead of calling Polly again",
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="don't read or add to the output file cache",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="number of template items to process at once",
+        type=int,
+        default=DEFAULT_WORKERS,
+    )
+    parser.add_argument(
+        "--max-rate",
+        help="max Polly requests per second, e.g. the account's TPS quota, default no limit other than --workers",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
         "--log-level",
         help="set exact logging level",
         choices=["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"],
         default=None,
     )
     args: argparse.Namespace = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.max_rate is not None and args.max_rate <= 0:
+        parser.error("--max-rate must be greater than 0")
 
     level: Literal[20] = getattr(logging, args.log_level) if args.log_level else logging.INFO
     logging.basicConfig(level=level, format="%(levelname)s: %(message)s")
@@ -303,12 +1043,36 @@ def main() -> int:
         logger.exception("AWS_PROFILE not set in environment")
         return 1
 
+    # a pooled connection for every worker, so more workers than the default pool size don't wait for one
+    client_config: Config = POLLY_CLIENT_CONFIG.merge(
+        Config(max_pool_connections=max(POLLY_CLIENT_CONFIG.max_pool_connections, args.workers))
+    )
+
     try:
-        polly_client: PollyClient = Session(profile_name=aws_profile).client("polly")  # type: ignore
+        polly_client: PollyClient = Session(profile_name=aws_profile).client("polly", config=client_config)  # type: ignore
     except (ClientError, NoCredentialsError):
         logger.exception("Failed to initialize AWS Polly client")
         return 1
 
+    # Boto3 resolves credentials and opens its first connection lazily. Do that now with a cheap call, so an
+    # auth problem is reported before any work starts instead of by the first item, and check the voice.
+    try:
+        voice_ids: set[str] | None = describe_voice_ids(polly_client, Engine=args.engine)
+    except (BotoCoreError, ClientError):
+        logger.exception("Failed to connect to AWS Polly, check AWS credentials for profile %s", aws_profile)
+        return 1
+    if voice_ids is not None and args.voice not in voice_ids:
+        logger.error("Error: AWS Polly voice '%s' does not support engine '%s'", args.voice, args.engine)
+        return 1
+
+    s3_client: BaseClient | None = None
+    if args.s3_bucket:
+        try:
+            s3_client = Session(profile_name=aws_profile).client("s3", config=client_config)
+        except (ClientError, NoCredentialsError):
+            logger.exception("Failed to initialize AWS S3 client")
+            return 1
+
     return ttsfromtemplate_awspolly(
         polly_client=polly_client,
         voiceid=args.voice,
@@ -317,6 +1081,12 @@ def main() -> int:
         languagecode=args.languagecode,
         engine=args.engine,
         outputformat=args.outputformat,
+        max_workers=args.workers,
+        s3_client=s3_client,
+        s3_bucket=args.s3_bucket,
+        reencode=not bool(args.no_reencode),
+        cache_dir=None if args.no_cache else Path(args.cache_dir),
+        max_rate=args.max_rate,
     )
 
 
@@ -20,44 +20,272 @@ ssml_text: (optional) SSML marked up text, empty string if none
 """
 
 import argparse
-import json
+import hashlib
 import logging
 import os
 import sys
-import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from json import JSONDecodeError
 from pathlib import Path
 from typing import Literal
+from urllib.parse import urlparse
 
 import ffmpeg
 import requests
 import ttsmapi
-from requests.exceptions import HTTPError, ReadTimeout
+from ffmpeg import FFMpegExecuteError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
 from ttsmapi.enums import VoiceIdEnum
 from ttsmapi.exceptions import TTSMAPIError
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from urllib3.util.retry import Retry
 
 import ttsutil
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_WORKERS = 4  # template items processed at once, downloads and ffmpeg overlap the next generate request
+PROGRESS_INTERVAL = 16  # log a progress line every this many created files, each file is logged at DEBUG
+DOWNLOAD_TIMEOUT = 30  # seconds to wait for the audio file server to respond
+DOWNLOAD_RETRIES = 5  # retries of a failed audio file download, with exponential backoff
+# HTTP statuses of audio file downloads that are retried, the server is busy or briefly failing
+DOWNLOAD_RETRY_STATUSES: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+# ffmpeg input format of downloaded audio files by URL file extension, others are probed by ffmpeg
+AUDIO_URL_FORMATS: dict[str, str] = {".mp3": "mp3", ".wav": "wav", ".ogg": "ogg"}
+DEFAULT_CACHE_DIR: Path = ttsutil.CACHE_ROOT / "ttsmonster"  # default directory of cached output files
 MAX_VOL_DB_OFFSET = -0.5  # max volume normalization offset for safety
 SHORT_TEXT_LENGTH = 9  # TTS text length of this or less gets extra TTS file size allowance
 BIT_ALLOWANCE_PER_CHAR = 2048  # 2KB per character allowed in output TTS file size
 EXTRA_BITS_FOR_SHORT = 1024  # +1KB per character allowance for very short text
 
+# public voice IDs by upper case name, and the set of them, built once instead of walking VoiceIdEnum per lookup
+_PUBLIC_VOICE_IDS_BY_NAME: dict[str, str] = {member.name: str(member.value) for member in VoiceIdEnum}
+_PUBLIC_VOICE_IDS: frozenset[str] = frozenset(_PUBLIC_VOICE_IDS_BY_NAME.values())
+
+
+def _create_download_session(pool_size: int) -> requests.Session:
+    """Create a requests session for downloading generated audio files, shared by all worker threads.
+
+    The session keeps connections to the audio file server open between downloads, so each doesn't need
+    its own TCP and TLS handshake. Failed connections and DOWNLOAD_RETRY_STATUSES responses are retried
+    inside the connection pool with exponential backoff, honoring any Retry-After header.
+
+    Args:
+        pool_size (int): max connections kept open, at least the number of worker threads.
+
+    Returns:
+        requests.Session: the session. Close it when done.
+
+    """
+    retry = Retry(total=DOWNLOAD_RETRIES, backoff_factor=0.5, status_forcelist=DOWNLOAD_RETRY_STATUSES)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _resolve_voiceid(voice: VoiceIdEnum | str) -> str | None:
+    """Get the TTS.Monster voice ID of a public voice name or ID.
+
+    Args:
+        voice (VoiceIdEnum | str): public voice name (any case) or ID
+
+    Returns:
+        str | None: the voice ID, or None if it doesn't match any public voice
+
+    """
+    if isinstance(voice, VoiceIdEnum):
+        return str(voice.value)
+    return _PUBLIC_VOICE_IDS_BY_NAME.get(voice.upper()) or (voice if voice in _PUBLIC_VOICE_IDS else None)
+
+
+def _cache_key(voiceid: str, tts_text: str, *, fast: bool) -> str:
+    """Get the cache key of an output file, a hash of everything that affects its content.
+
+    Args:
+        voiceid (str): TTS.Monster voice ID
+        tts_text (str): the text to generate
+        fast (bool): whether the audio is sped up with ffmpeg atempo, for SSML rate='fast'
+
+    Returns:
+        str: hex sha256 digest
+
+    """
+    return hashlib.sha256("|".join((voiceid, str(fast), tts_text)).encode("utf-8")).hexdigest()
+
+
+def _process_item(
+    item: dict[str, str],
+    file_fullpath: Path,
+    ttsmapi_client: ttsmapi.Client,
+    voiceid: str,
+    session: requests.Session,
+    rate_limiter: ttsutil.RateLimiter | None = None,
+    *,
+    generate_lock: threading.Lock,
+    quality_checks: bool = True,
+) -> tuple[int, int]:
+    """Create a single TTS file for a template item with TTS.Monster, then normalize its volume with ffmpeg.
+
+    Run in worker threads, so it only touches its own item and output file. The output directory must exist.
+
+    Args:
+        item (dict[str, str]): the template item
+        file_fullpath (Path): the TTS file to create
+        ttsmapi_client (ttsmapi.Client): TTS.Monster API client, shared between threads
+        voiceid (str): TTS.Monster voice ID to use
+        session (requests.Session): session for downloading the audio file, shared between threads
+        rate_limiter (ttsutil.RateLimiter | None): limits TTS.Monster generate requests, shared between
+            threads. Defaults to None, no limit.
+        generate_lock (threading.Lock): held during the TTS.Monster generate request, shared between threads so
+            requests are sent one at a time.
+        quality_checks (bool): Whether to perform quality checks on the generated TTS file.
+
+    Returns:
+        tuple[int, int]: 0 on success, 1 on error that should stop processing, 2 if the item was skipped;
+            and the account's characters used as of this item, 0 if unknown.
+
+    """
+    tts_text: str = item["tts_text"]
+    ssml_text: str = item["ssml_text"]  # TTS.Monster does not support SSML, but we may simulate some features
+
+    # print(f"Sent Generate(voice_id={args.voiceid}, message={tts_text})...")
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    start_time: float = time.perf_counter()
+
+    try:
+        # ttsmapi doesn't document that its client is thread safe, and with enforce_char_quota it checks the
+        # quota before a request and only learns the new usage from the response. Concurrent requests could
+        # each pass the check and go over the allowance together, so they're sent one at a time.
+        with generate_lock:
+            response: dict = ttsmapi_client.generate(voice_id=voiceid, message=tts_text)
+    except (requests.ConnectionError, requests.Timeout):
+        # On ConnectionError or Timeout, assume TTS.Monster is flaky, just skip to the next item.
+        # Not retried, since the characters may have been used already.
+        logger.exception("TTS.M API connection error, skipping item")
+        return 2, 0
+    except (TTSMAPIError, HTTPError):
+        logger.exception("TTS.M API error during TTS generation")
+        logger.exception("Template item: %s", item)
+        logger.exception("Call: generate('%s', '%s')", voiceid, tts_text)
+        return 1, 0
+
+    logger.debug("Generate() completed in %.2fs", time.perf_counter() - start_time)
+
+    if "url" not in response:
+        logger.error("No audio URL in TTS.Monster response")
+        return 1, 0
+
+    # Retrieve the audio file with Requests, and decode it to PCM WAV in memory once. The peak is measured
+    # from the decoded samples in Python, and the same samples are piped to ffmpeg to be filtered and encoded,
+    # so the audio is never decoded twice or written to a temporary file.
+    # The response body is streamed to ffmpeg as it arrives, so downloading and decoding overlap.
+    input_format: str | None = AUDIO_URL_FORMATS.get(Path(urlparse(response["url"]).path).suffix.lower())
+    try:
+        with session.get(response["url"], timeout=DOWNLOAD_TIMEOUT, stream=True) as url_response:
+            url_response.raise_for_status()
+            url_response.raw.decode_content = True  # undo any Content-Encoding, like .content does
+            wav_bytes: bytes = ttsutil.decode_stream_to_wav(url_response.raw, input_format)
+    except (requests.RequestException, Urllib3HTTPError):
+        # the session already retried, so give up on this item but keep the rest of the run going
+        logger.exception("Failed to get audio file from TTS.Monster returned URL, skipping item %s", item)
+        return 2, 0
+    except OSError:
+        logger.exception("Error streaming audio file from TTS.Monster returned URL to ffmpeg")
+        return 1, 0
+    except FFMpegExecuteError:
+        logger.exception("Error decoding audio file from TTS.Monster returned URL")
+        return 1, 0
+
+    try:
+        max_volume: float = ttsutil.get_max_volume_wav(wav_bytes)
+    except ValueError:
+        logger.exception("Could not determine max volume of audio file")
+        return 1, 0
+
+    # Set ffmpeg input to stdin, the decoded WAV.
+    # ffmpeg will intelligently handle format conversion based on the extension of the output file.
+    input_stream: ffmpeg.AudioStream = ffmpeg.input("pipe:0")
+
+    # If "prosody rate='fast'" is set in SSML text, simulate that with ffmpeg atempo filter.
+    # AWS Polly SSML rate='fast' is ~150% (1.5) per experiments.
+    if "rate='fast'" in ssml_text:
+        input_stream = input_stream.atempo(tempo=1.3)
+
+    # TODO: trim silence, since TTS.Monster models are unstable and sometimes emit lengthy silence,
+    # among other issues.
+    # should probably first try passing an AudioStream to ttsutil.trim_silence(),
+    # returning the modified AudioStream, and if that doesn't work, write to a file and pass that back.
+    # ttsutil.trim_silence(input_stream, silence_threshold=-30.0, min_silence_duration=0.2)
+
+    # Files must be as loud as possible to be consistently audible in-game.
+    # If previously determined peak db is less than -0.5db, use ffmpeg volume filter
+    # to increase the file volume by the same amount, resulting in -0.5db peak.
+    # Unfortunately, other ffmpeg filters such as loudnorm or dynaudnorm do not
+    # work well for our purposes.
+    if max_volume < MAX_VOL_DB_OFFSET:
+        volume_adjustment: float = -max_volume - MAX_VOL_DB_OFFSET
+        input_stream = input_stream.volume(volume=f"{volume_adjustment}dB")
+
+    # Several items are encoded at once, so limit each ffmpeg to ttsutil.FFMPEG_THREADS.
+    output_stream: ffmpeg.dag.nodes.GlobalStream = input_stream.output(
+        filename=file_fullpath, extra_options={"threads": ttsutil.FFMPEG_THREADS}
+    ).global_args(
+        hide_banner=True,
+        loglevel="error",
+        filter_threads=ttsutil.FFMPEG_THREADS,
+        filter_complex_threads=ttsutil.FFMPEG_THREADS,
+    )
+
+    # Lastly, set the output file and run ffmpeg.
+    try:
+        output_stream.run(cmd=ttsutil.FFMPEG_BIN, input=wav_bytes, quiet=True)
+    except FFMpegExecuteError:
+        logger.exception("ffmpeg failed when writing output file %s", file_fullpath)
+        return 1, 0
+
+    # Reject the file if it's too long/too large since that indicates the
+    # TTS.Monster model failed to produce reasonable audio output.
+    # Just delete the file, exiting loop with error not desirable.
+    if quality_checks:
+        max_size: int = BIT_ALLOWANCE_PER_CHAR * len(tts_text)
+        if len(tts_text) <= SHORT_TEXT_LENGTH:
+            max_size += EXTRA_BITS_FOR_SHORT * len(tts_text)
+
+        file_size: int = file_fullpath.stat().st_size
+        if file_size > max_size:
+            logger.warning("Output %s is too large (%dKB), removing it", file_fullpath, file_size // 1024)
+            file_fullpath.unlink()
+            # implement a retry mechanism?
+            return 2, 0
+
+    return 0, response["characterUsage"]
+
 
 def ttsfromtemplate_ttsmonster(
     ttsmapi_client: ttsmapi.Client,
     voice: VoiceIdEnum | str,
     template_file: Path | None = None,
     output_dir: Path | None = None,
+    max_workers: int = DEFAULT_WORKERS,
     *,
     quality_checks: bool = True,
+    cache_dir: Path | None = None,
+    max_rate: float | None = None,
+    cancel_event: threading.Event | None = None,
 ) -> int:
     """Create a soundpack set of TTS mp3 files from a template JSON file, using TTS.Monster.
 
+    Template items are processed by a pool of worker threads. TTS.Monster generate requests are sent one at a
+    time, so the character quota is enforced correctly, while other workers download and encode earlier items.
+
     Args:
         ttsmapi_client (ttsmapi.Client): An existing initialized TTS.Monster API client.
         voice (VoiceIdEnum | str): TTS.Monster voice name or id to use. Names are only looked up for
@@ -65,10 +293,20 @@ def ttsfromtemplate_ttsmonster(
         template_file (Path, optional): Path to the input JSON template file. Defaults to "template.json".
         output_dir (Path, optional): the output directory containing a 'sounds' subdirectory to
             create the directory structure and tts files in. Defaults to current working directory.
+        max_workers (int, optional): number of template items to process at once. Defaults to DEFAULT_WORKERS.
         quality_checks (bool): Whether to perform quality checks on generated TTS files.
+        cache_dir (Path | None, optional): directory of output files from earlier runs, keyed by a hash of
+            their voice and text. Items found there are copied instead of generated, which also saves
+            characters. Newly generated files are only added to it when quality_checks is True. Quality
+            checks can't catch every bad take, and a cached one is copied again on every run until its cache
+            file is deleted, so the command line only uses a cache with --cache. Defaults to None, no cache.
+        max_rate (float | None, optional): max TTS.Monster generate requests per second, to stay under
+            the API's rate limit. Defaults to None, limited only by max_workers.
+        cancel_event (threading.Event | None, optional): set from another thread to stop the run, see
+            ttsutil.make_unique_texts(). Defaults to None, not cancellable.
 
     Returns:
-        int: 0 on success, 1 on error.
+        int: 0 on success, 1 on error or if cancelled.
 
     """
     template_file = template_file or Path("template.json")
@@ -76,31 +314,28 @@ def ttsfromtemplate_ttsmonster(
 
     sounds_dir: Path = output_dir / "sounds"
 
-    if not template_file.exists() or not template_file.is_file():
+    # is_file() and is_dir() are False for missing paths, so each check is a single stat
+    if not template_file.is_file():
         logger.error("Template file '%s' does not exist", template_file)
         return 1
-    if not output_dir.exists() or not output_dir.is_dir():
+    if not output_dir.is_dir():
         logger.error("Output directory '%s' does not exist", output_dir)
         return 1
-    if not sounds_dir.exists() or not sounds_dir.is_dir():
+    if not sounds_dir.is_dir():
         logger.error("Required subdirectory '%s' does not exist", sounds_dir)
         return 1
 
-    if isinstance(voice, str) and voice.upper() in VoiceIdEnum._member_names_:
-        voiceid = str(VoiceIdEnum[voice.upper()].value)
-    elif voice in VoiceIdEnum:
-        voiceid = str(voice)
-    else:
+    voiceid: str | None = _resolve_voiceid(voice)
+    if voiceid is None:
         logger.warning("Specified voice name or ID '%s' does not match any public voice", voice)
         logger.warning("Proceeding with the assumption that it's a private voice ID")
         voiceid = str(voice)
 
-    with Path.open(template_file, encoding="utf-8") as f:
-        try:
-            template_data: list[dict[str, str]] = json.load(f)
-        except (JSONDecodeError, UnicodeDecodeError) as e:
-            logger.exception("Failed to load template file: %s", type(e).__name__)
-            return 1
+    try:
+        template_data: list[dict[str, str]] = ttsutil.load_template(template_file)
+    except (OSError, JSONDecodeError, UnicodeDecodeError) as e:
+        logger.exception("Failed to load template file: %s", type(e).__name__)
+        return 1
 
     logger.info(
         "TTS.Monster API client ready: Current plan: '%s', Characters used: %d / %d",
@@ -109,124 +344,94 @@ def ttsfromtemplate_ttsmonster(
         ttsmapi_client.user_info["character_allowance"],
     )
 
+    # skip template entries that already exist as files before submitting any work
+    pending: list[tuple[dict[str, str], Path]] = ttsutil.find_pending(template_data, sounds_dir)
     created_count: int = 0
-    skipped_count: int = 0
-    total_elapsed: float = 0.0
+    skipped_count: int = len(template_data) - len(pending)
+    create_total: int = len(pending)
 
-    # For each template entry that doesn't already exist as a file, call TTS.Monster API to create a TTS file,
-    # then retrieve the TTS file from the URL returned by the API.
-    for item in template_data:
-        file_partialpath: Path = Path(item["path"])
-        tts_text: str = item["tts_text"]
-        ssml_text: str = item["ssml_text"]  # TTS.Monster does not support SSML, but we may simulate some features
-
-        file_fullpath: Path = sounds_dir / file_partialpath
-        # skip if file already exists
-        if file_fullpath.exists():
-            skipped_count += 1
-            continue
-
-        # need to create output directory (and intermediates) if they don't exist
-        if not file_fullpath.parent.exists():
-            file_fullpath.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+    try:
+        ttsutil.make_parent_dirs(file_fullpath for _, file_fullpath in pending)
+    except OSError:
+        logger.exception("Error creating output directories")
+        return 1
 
-        # print(f"Sent Generate(voice_id={args.voiceid}, message={tts_text})...")
-        start_time: float = time.perf_counter()
+    # Items with the same text and speed produce the same audio, since the voice is the same for the whole run.
+    # Only generate the first of each, then link or copy its output file to the rest, which also saves characters.
+    unique_texts: dict[tuple[str, bool], list[tuple[dict[str, str], Path]]] = ttsutil.group_by_text(
+        pending, lambda item: (item["tts_text"], "rate='fast'" in item["ssml_text"])
+    )
 
+    cache_paths: dict[tuple[str, bool], Path] = {}  # text key -> cache path, of texts to generate
+    if cache_dir is not None:
         try:
-            response: dict = ttsmapi_client.generate(voice_id=voiceid, message=tts_text)
-        except (ConnectionError, ReadTimeout):
-            # On ConnectionError or ReadTimeout, assume TTS.Monster is flaky, just continue to next item
-            logger.exception("TTS.M API connection error, skipping item")
-            continue
-        except (TTSMAPIError, HTTPError):
-            logger.exception("TTS.M API error during TTS generation")
-            logger.exception("Template item: %s", item)
-            logger.exception("Call: generate('%s', '%s')", voice, tts_text)
-            return 1
-
-        # print(f"Generate() completed in {time.perf_counter() - start_time:.2f}s")
-        total_elapsed += time.perf_counter() - start_time
-
-        # suppress ffmpeg INFO log messages
-        logging.getLogger("ffmpeg").setLevel(logging.WARNING)
-
-        if "url" in response:
-            # Retrieve the audio file with Requests to a tempfile. Unfortunately necessary because of
-            # the need to do two-pass ffmpeg processing. Otherwise ffmpeg could get the file itself.
-            try:
-                url_response: requests.Response = requests.get(response["url"], timeout=30)
-                with tempfile.NamedTemporaryFile(suffix=Path(response["url"]).suffix) as f:
-                    f.write(url_response.content)
-                    try:
-                        max_volume: float = ttsutil.get_max_volume(f.name)
-                    except ValueError:
-                        logger.exception("Could not determine max volume of audio file")
-                        return 1
-
-                    # Set ffmpeg input to the tempfile.
-                    # ffmpeg will intelligently handle format conversion based on the extension of the output file.
-                    input_stream: ffmpeg.AudioStream = ffmpeg.input(f.name)
-
-                    # If "prosody rate='fast'" is set in SSML text, simulate that with ffmpeg atempo filter.
-                    # AWS Polly SSML rate='fast' is ~150% (1.5) per experiments.
-                    if "rate='fast'" in ssml_text:
-                        input_stream = input_stream.atempo(tempo=1.3)
-
-                    # TODO: trim silence, since TTS.Monster models are unstable and sometimes emit lengthy silence,
-                    # among other issues.
-                    # should probably first try passing an AudioStream to ttsutil.trim_silence(),
-                    # returning the modified AudioStream, and if that doesn't work, write to a file and pass that back.
-                    # ttsutil.trim_silence(input_stream, silence_threshold=-30.0, min_silence_duration=0.2)
-
-                    # Files must be as loud as possible to be consistently audible in-game.
-                    # If previously determined peak db is less than -0.5db, use ffmpeg volume filter
-                    # to increase the file volume by the same amount, resulting in -0.5db peak.
-                    # Unfortunately, other ffmpeg filters such as loudnorm or dynaudnorm do not
-                    # work well for our purposes.
-                    if max_volume < MAX_VOL_DB_OFFSET:
-                        volume_adjustment: float = -max_volume - MAX_VOL_DB_OFFSET
-                        input_stream = input_stream.volume(volume=f"{volume_adjustment}dB")
-
-                    # Lastly, set the output file and run ffmpeg.
-                    input_stream.output(filename=file_fullpath).run(quiet=True)
-
-                    # Reject the file if it's too long/too large since that indicates the
-                    # TTS.Monster model failed to produce reasonable audio output.
-                    # Just delete the file, exiting loop with error not desirable.
-                    if quality_checks:
-                        max_size: int = BIT_ALLOWANCE_PER_CHAR * len(tts_text)
-                        if len(tts_text) <= SHORT_TEXT_LENGTH:
-                            max_size += EXTRA_BITS_FOR_SHORT * len(tts_text)
-
-                        if file_fullpath.stat().st_size > max_size:
-                            logger.warning(
-                                "Output %s is too large (%dKB), removing it",
-                                file_fullpath,
-                                file_fullpath.stat().st_size // 1024,
-                            )
-                            file_fullpath.unlink()
-                            # implement a retry mechanism?
-                            continue
-
-            except (OSError, HTTPError, ReadTimeout):
-                logger.exception("Failed to get audio file from TTS.Monster returned URL")
-                return 1
-        else:
-            logger.error("No audio URL in TTS.Monster response")
+            cache_paths, created_count = ttsutil.copy_cached(
+                unique_texts, cache_dir, lambda text_key: _cache_key(voiceid, text_key[0], fast=text_key[1])
+            )
+        except OSError:
+            logger.exception("Error copying cached files from %s", cache_dir)
             return 1
+        if created_count:
+            logger.info("Copied %d file(s) from cache %s", created_count, cache_dir)
+    if not quality_checks:
+        # Only files that passed quality checks are cached, so --skipqa output is never reused later.
+        cache_paths.clear()
+
+    # suppress ffmpeg INFO log messages
+    logging.getLogger("ffmpeg").setLevel(logging.WARNING)
+
+    session: requests.Session = _create_download_session(max_workers)
+    process_item = partial(
+        _process_item,
+        ttsmapi_client=ttsmapi_client,
+        voiceid=voiceid,
+        session=session,
+        rate_limiter=ttsutil.RateLimiter(max_rate) if max_rate else None,
+        generate_lock=threading.Lock(),
+        quality_checks=quality_checks,
+    )
 
-        created_count += 1
-        # if created_count > 1:
-        #    print("\033[1A", end="\x1b[2K")
-        logger.info(
-            "Created file %d/~%d: %s. Used: %d/%d chars",
-            created_count,
-            len(template_data) - created_count - skipped_count + 1,
-            file_fullpath,
-            response["characterUsage"],
-            ttsmapi_client.user_info["character_allowance"],
+    # For each template entry that doesn't already exist as a file, call TTS.Monster API to create a TTS file,
+    # then retrieve the TTS file from the URL returned by the API.
+    # Generate requests are sent one at a time (see _process_item), but each item's download, decode and encode
+    # overlap the next item's request, so worker threads still process several items at once.
+    # Longest texts are submitted first, since they take longest to generate. Otherwise a long one started
+    # near the end can leave the other workers idle while it finishes.
+    unique_texts = {
+        text_key: unique_texts[text_key]
+        for text_key in sorted(unique_texts, key=lambda text_key: len(text_key[0]), reverse=True)
+    }
+    # account characters used as of the latest generated item, for progress lines
+    character_usage: int = ttsmapi_client.user_info["character_usage"]
+
+    def process_text(_text_key: tuple[str, bool], item: dict[str, str], file_fullpath: Path) -> int:
+        nonlocal character_usage
+        retcode, item_character_usage = process_item(item, file_fullpath)
+        character_usage = max(character_usage, item_character_usage)
+        return retcode
+
+    copied_count: int = created_count
+    start_time: float = time.perf_counter()
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        retcode, made_count = ttsutil.make_unique_texts(
+            executor,
+            unique_texts,
+            process_text,
+            cache_paths,
+            lambda made: logger.info(
+                "Created %d/%d files. Used: %d/%d chars",
+                copied_count + made,
+                create_total,
+                character_usage,
+                ttsmapi_client.user_info["character_allowance"],
+            ),
+            PROGRESS_INTERVAL,
+            cancel_event,
         )
+    created_count += made_count
+    if retcode != 0:
+        return 1
+    total_elapsed: float = time.perf_counter() - start_time
 
     logger.info(
         "Successfully finished. %d file(s) created and %d existing file(s) skipped in %s. %d total.",
@@ -267,6 +472,30 @@ def main() -> int:
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory of the output file cache used with --cache",
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--cache",
+        help="reuse output files cached by content instead of calling TTS.Monster again, and add new ones",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="number of template items to process at once",
+        type=int,
+        default=DEFAULT_WORKERS,
+    )
+    parser.add_argument(
+        "--max-rate",
+        help="max TTS.Monster requests per second, default no limit other than --workers",
+        type=float,
+        default=None,
+    )
     parser.add_argument(
         "-l",
         "--log-level",
@@ -275,6 +504,10 @@ def main() -> int:
         help="set the logging output level",
     )
     args: argparse.Namespace = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.max_rate is not None and args.max_rate <= 0:
+        parser.error("--max-rate must be greater than 0")
 
     level: Literal[20] = getattr(logging, args.log_level) if args.log_level else logging.INFO
     logging.basicConfig(level=level, format="%(levelname)s: %(message)s")
@@ -298,7 +531,10 @@ def main() -> int:
         voice=args.voiceid,
         template_file=Path(args.file),
         output_dir=Path(args.directory),
+        max_workers=args.workers,
         quality_checks=not bool(args.skipqa),
+        cache_dir=Path(args.cache_dir) if args.cache else None,
+        max_rate=args.max_rate,
     )
 
 
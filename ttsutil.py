@@ -1,10 +1,87 @@
-"""Utility functions for processing TTS audio."""
+"""Utility functions for processing TTS templates, soundpack directories, and audio."""
 
+import contextlib
+import io
+import json
+import logging
+import math
 import os
 import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from array import array
+from collections.abc import Callable, Container, Hashable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import IO, Any, BinaryIO, TypeVar
 
 import ffmpeg
+from ffmpeg import FFMpegExecuteError
+
+try:
+    # optional, parses templates several times faster than stdlib json
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads: Callable[[bytes], Any] = json.loads
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg executable, found on PATH once instead of for every ffmpeg process started
+FFMPEG_BIN: str = shutil.which("ffmpeg") or "ffmpeg"
+STREAM_CHUNK_SIZE = 64 * 1024  # bytes copied at a time when streaming audio to ffmpeg
+# threads for each ffmpeg encoder and filter graph. Clips are short and several ffmpeg processes run at once
+# from worker threads, so ffmpeg's default of a thread per core only oversubscribes the CPU.
+# typed-ffmpeg always passes filters with -filter_complex, which is limited by -filter_complex_threads,
+# not -filter_threads, so pass both.
+FFMPEG_THREADS = 1
+# parent of each TTS service's default directory of output files cached by content, reused by later runs.
+# Not inside the soundpack directory, which is zipped for release as a whole.
+CACHE_ROOT: Path = Path.home() / ".cache" / "ttsutil"
+# max volume line of ffmpeg volumedetect output, matched on the raw stderr bytes without decoding them
+_MAX_VOLUME_RE: re.Pattern[bytes] = re.compile(rb"max_volume:\s*(-?\d+(?:\.\d+)?) dB")
+
+# a TTS service's key for items that produce the same audio, e.g. (text, text type)
+_TextKey = TypeVar("_TextKey", bound=Hashable)
+
+
+def load_template(template_file: Path) -> list[dict[str, str]]:
+    """Load a TTS template json file.
+
+    The file is read as raw bytes and parsed with orjson if it is installed, otherwise stdlib json.
+
+    Args:
+        template_file (Path): path to the template json file.
+
+    Returns:
+        list[dict[str, str]]: template entries, each with "path", "tts_text" and "ssml_text" keys.
+
+    Raises:
+        OSError: If the file could not be read.
+        json.JSONDecodeError: If the file is not valid json (orjson's error is a subclass).
+        UnicodeDecodeError: If the file is not valid UTF-8.
+
+    """
+    return _json_loads(template_file.read_bytes())
+
+
+def canonical_path(path: str) -> str:
+    """Normalize a template path for comparison, so paths written on Windows and POSIX match.
+
+    Backslashes become "/" and case is folded, since soundpacks are used on case-insensitive filesystems.
+
+    Args:
+        path (str): template path relative to the sounds dir.
+
+    Returns:
+        str: canonical form of the path, only for comparisons.
+
+    """
+    return path.replace("\\", "/").casefold()
 
 
 def get_max_volume(filepath: str) -> float:
@@ -33,11 +110,32 @@ def get_max_volume(filepath: str) -> float:
     else:
         input_stream: ffmpeg.AudioStream = ffmpeg.input(filepath)
 
-    output_stream: ffmpeg.dag.OutputStream = input_stream.volumedetect().output(filename=os.devnull, f="null")
+    return _volumedetect(input_stream)
+
+
+def _volumedetect(input_stream: ffmpeg.AudioStream) -> float:
+    """Run ffmpeg volumedetect on an input stream and parse the maximum volume.
+
+    Args:
+        input_stream (ffmpeg.AudioStream): the audio to measure.
+
+    Returns:
+        float: Maximum volume in dB from ffmpeg output.
+
+    Raises:
+        FFMpegExecuteError: If ffmpeg command fails to execute.
+        ValueError: If max_volume could not be found in ffmpeg output.
+
+    """
+    output_stream: ffmpeg.dag.nodes.GlobalStream = (
+        input_stream.volumedetect()
+        .output(filename=os.devnull, f="null", extra_options={"threads": FFMPEG_THREADS})
+        .global_args(filter_threads=FFMPEG_THREADS, filter_complex_threads=FFMPEG_THREADS)
+    )
     # for some reason the output is in stderr instead of stdout
-    stderr: str = output_stream.run(capture_stderr=True)[1].decode("utf-8")
+    stderr: bytes = output_stream.run(cmd=FFMPEG_BIN, capture_stderr=True)[1]
 
-    max_volume_match: re.Match[str] | None = re.search(r"max_volume:\s*(-?\d+(\.\d+)?) dB", stderr)
+    max_volume_match: re.Match[bytes] | None = _MAX_VOLUME_RE.search(stderr)
     if not max_volume_match:
         msg = "Could not find max_volume in ffmpeg output."
         raise ValueError(msg)
@@ -46,6 +144,457 @@ def get_max_volume(filepath: str) -> float:
     return max_volume
 
 
+def get_max_volume_pcm(data: bytes) -> float:
+    """Get the maximum volume of raw signed 16-bit little-endian PCM audio in Python, without running ffmpeg.
+
+    Gives the same peak level as get_max_volume() (ffmpeg volumedetect), unrounded.
+
+    Args:
+        data (bytes): raw audio samples, e.g. AWS Polly PCM output.
+
+    Returns:
+        float: Maximum volume in dB relative to full scale.
+
+    """
+    samples: array[int] = array("h")
+    samples.frombytes(data[: len(data) // 2 * 2])  # ignore a trailing partial sample
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    peak: int = max(max(samples, default=0), -min(samples, default=0))
+    if peak == 0:
+        return -91.0  # same floor as ffmpeg volumedetect for silence
+    return 20 * math.log10(peak / 32768)
+
+
+def decode_to_wav(data: bytes, input_format: str | None = None) -> bytes:
+    """Decode in-memory audio to 16-bit PCM WAV with ffmpeg, piping it through ffmpeg's stdin and stdout.
+
+    Decoding once to PCM lets the peak be measured in Python and the samples be re-encoded without
+    decoding the compressed audio a second time. The sample rate and channels are kept as they are.
+
+    Args:
+        data (bytes): contents of an ffmpeg-compatible audio file, such as mp3 or ogg.
+        input_format (str | None): ffmpeg format name of data, e.g. "mp3". A pipe has no file extension
+            for ffmpeg to go by, so this skips probing the data for its format. Default None, probe it.
+
+    Returns:
+        bytes: WAV file contents.
+
+    Raises:
+        FFMpegExecuteError: If ffmpeg command fails to execute.
+
+    """
+    output_stream: ffmpeg.dag.nodes.GlobalStream = (
+        ffmpeg.input("pipe:0", f=input_format)
+        .output(filename="pipe:1", f="wav", acodec="pcm_s16le", extra_options={"threads": FFMPEG_THREADS})
+        .global_args(hide_banner=True, loglevel="error", filter_threads=FFMPEG_THREADS)
+    )
+    return output_stream.run(cmd=FFMPEG_BIN, input=data, capture_stdout=True, capture_stderr=True)[0]
+
+
+def decode_stream_to_wav(stream: BinaryIO, input_format: str | None = None) -> bytes:
+    """Decode audio to 16-bit PCM WAV with ffmpeg while it's still being read, e.g. from a network response.
+
+    The stream is copied to ffmpeg's stdin in chunks from a separate thread, so receiving and decoding
+    the audio overlap instead of waiting for all of it first. ffmpeg's stderr is read from another thread,
+    so neither output pipe can fill up and block ffmpeg. Otherwise the same as decode_to_wav().
+
+    Args:
+        stream (BinaryIO): readable stream of an ffmpeg-compatible audio file, such as mp3 or ogg.
+        input_format (str | None): ffmpeg format name of the stream, see decode_to_wav(). Default None.
+
+    Returns:
+        bytes: WAV file contents.
+
+    Raises:
+        FFMpegExecuteError: If ffmpeg command fails to execute.
+        Exception: Any exception raised while reading the stream is re-raised.
+
+    """
+    process: subprocess.Popen[bytes] = (
+        ffmpeg.input("pipe:0", f=input_format)
+        .output(filename="pipe:1", f="wav", acodec="pcm_s16le", extra_options={"threads": FFMPEG_THREADS})
+        .global_args(hide_banner=True, loglevel="error", filter_threads=FFMPEG_THREADS)
+        .run_async(cmd=FFMPEG_BIN, pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+    )
+    stdin: IO[bytes] = process.stdin  # type: ignore[assignment]
+    read_errors: list[Exception] = []
+
+    def feed_stdin() -> None:
+        try:
+            shutil.copyfileobj(stream, stdin, STREAM_CHUNK_SIZE)
+        except BrokenPipeError:
+            pass  # ffmpeg exited early, which is reported from its return code
+        except Exception as e:  # noqa: BLE001
+            read_errors.append(e)
+        finally:
+            with contextlib.suppress(BrokenPipeError):
+                stdin.close()
+
+    stderr_chunks: list[bytes] = []
+
+    def drain_stderr() -> None:
+        stderr_chunks.append(process.stderr.read())  # type: ignore[union-attr]
+
+    feeder = threading.Thread(target=feed_stdin, daemon=True)
+    feeder.start()
+    # stderr is read in its own thread, since ffmpeg blocks if it fills the stderr pipe while stdout is read
+    # here, e.g. with a line of decode errors per frame of a corrupt mp3
+    stderr_reader = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_reader.start()
+    stdout: bytes = process.stdout.read()  # type: ignore[union-attr]
+    stderr_reader.join()
+    process.wait()
+    feeder.join()
+    stderr: bytes = b"".join(stderr_chunks)
+
+    if read_errors:
+        raise read_errors[0]
+    if process.returncode:
+        raise FFMpegExecuteError(process.returncode, subprocess.list2cmdline(process.args), stdout, stderr)  # type: ignore[arg-type]
+    return stdout
+
+
+def get_max_volume_wav(data: bytes) -> float:
+    """Get the maximum volume of in-memory 16-bit PCM WAV audio in Python, without running ffmpeg.
+
+    Args:
+        data (bytes): WAV file contents, e.g. from decode_to_wav().
+
+    Returns:
+        float: Maximum volume in dB relative to full scale. See get_max_volume_pcm().
+
+    Raises:
+        ValueError: If data is not 16-bit PCM WAV audio.
+
+    """
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            if wav.getsampwidth() != 2:  # noqa: PLR2004
+                msg = f"Expected 16-bit WAV audio, got {wav.getsampwidth() * 8}-bit."
+                raise ValueError(msg)
+            # ffmpeg can't seek back to fill in the length when writing to a pipe, so read to the end
+            frames: bytes = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        msg = f"Could not read WAV audio: {e}"
+        raise ValueError(msg) from e
+    return get_max_volume_pcm(frames)
+
+
+def concat_wav(wavs: list[bytes]) -> bytes:
+    """Join in-memory WAV audio clips with the same format into one WAV, in order.
+
+    Args:
+        wavs (list[bytes]): WAV file contents, e.g. from decode_to_wav(). Must not be empty.
+
+    Returns:
+        bytes: WAV file contents with the audio of all clips
+
+    Raises:
+        ValueError: If a clip is not WAV audio, or its channels, sample width or rate differ from the first.
+
+    """
+    output = io.BytesIO()
+    try:
+        with wave.open(output, "wb") as out_wav:
+            for i, data in enumerate(wavs):
+                with wave.open(io.BytesIO(data)) as wav:
+                    params: tuple[int, int, int] = (wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+                    if i == 0:
+                        out_wav.setnchannels(params[0])
+                        out_wav.setsampwidth(params[1])
+                        out_wav.setframerate(params[2])
+                    elif params != (out_wav.getnchannels(), out_wav.getsampwidth(), out_wav.getframerate()):
+                        msg = f"WAV clip {i} format {params} differs from the first clip."
+                        raise ValueError(msg)
+                    # see get_max_volume_wav(), piped WAV headers have no length, so read to the end
+                    out_wav.writeframes(wav.readframes(wav.getnframes()))
+    except (wave.Error, EOFError) as e:
+        msg = f"Could not read WAV audio: {e}"
+        raise ValueError(msg) from e
+    return output.getvalue()
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """Hard link a file to a new path, or copy it if a hard link isn't possible.
+
+    A hard link takes no extra disk space or data copying. Copying is the fallback for filesystems
+    without hard links or paths on different devices.
+
+    Args:
+        src (Path): the existing file.
+        dst (Path): the new file path, which must not exist.
+
+    Raises:
+        OSError: If the file could not be linked or copied.
+
+    """
+    try:
+        dst.hardlink_to(src)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def copy_atomic(src: Path, dst: Path) -> None:
+    """Copy a file so dst is either absent or complete, never partially written.
+
+    The copy is written to a temporary file in dst's directory, then renamed over dst. Readers such as
+    another run sharing a cache directory, or a later run after this one was interrupted, never see a
+    truncated file.
+
+    Args:
+        src (Path): the existing file.
+        dst (Path): the file to create or replace.
+
+    Raises:
+        OSError: If the file could not be copied or renamed.
+
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=dst.parent, prefix=f".{dst.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_name)
+        os.replace(tmp_name, dst)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_name)
+        raise
+
+
+def find_pending(template_data: list[dict[str, str]], sounds_dir: Path) -> list[tuple[dict[str, str], Path]]:
+    """Get the template items whose file doesn't exist yet in a soundpack's sounds directory.
+
+    Walking the sounds dir once is much cheaper than checking each template path with its own stat.
+
+    Args:
+        template_data (list[dict[str, str]]): template items, see load_template().
+        sounds_dir (Path): the soundpack's "sounds" directory.
+
+    Returns:
+        list[tuple[dict[str, str], Path]]: (item, output file path) of each missing file, in template order.
+
+    """
+    existing_paths: set[str] = {canonical_path(relpath) for _, relpath in walk_files(sounds_dir)}
+    return [
+        (item, sounds_dir / item["path"])
+        for item in template_data
+        if canonical_path(item["path"]) not in existing_paths
+    ]
+
+
+def make_parent_dirs(file_paths: Iterable[Path]) -> None:
+    """Create the parent directory of each file, once each, so worker threads never race to create them.
+
+    Args:
+        file_paths (Iterable[Path]): files that are about to be written.
+
+    Raises:
+        OSError: If a directory could not be created.
+
+    """
+    for parent in {file_path.parent for file_path in file_paths}:
+        parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+
+
+def group_by_text(
+    pending: list[tuple[dict[str, str], Path]], text_key: Callable[[dict[str, str]], _TextKey]
+) -> dict[_TextKey, list[tuple[dict[str, str], Path]]]:
+    """Group template items that produce the same audio, so each text is only made once per run.
+
+    Args:
+        pending (list[tuple[dict[str, str], Path]]): (item, output file path) of each file to create.
+        text_key (Callable[[dict[str, str]], _TextKey]): gets the key of an item, equal for items with the
+            same audio. Everything else that affects the audio, such as the voice, is the same for the run.
+
+    Returns:
+        dict[_TextKey, list[tuple[dict[str, str], Path]]]: text key -> (item, output file path) of each file
+            with that text, in template order. The first file of each is the one to make, see fan_out().
+
+    """
+    unique_texts: dict[_TextKey, list[tuple[dict[str, str], Path]]] = {}
+    for item, file_path in pending:
+        unique_texts.setdefault(text_key(item), []).append((item, file_path))
+    return unique_texts
+
+
+def copy_cached(
+    unique_texts: dict[_TextKey, list[tuple[dict[str, str], Path]]],
+    cache_dir: Path,
+    cache_key: Callable[[_TextKey], str],
+) -> tuple[dict[_TextKey, Path], int]:
+    """Copy output files cached by an earlier run, with any voice set or output dir, instead of making them.
+
+    Texts found in the cache are removed from unique_texts, so only the rest are made. The cache holds copies
+    rather than hard links, so editing a soundpack file in place never changes it. Each copied file is logged
+    with its cache file, so a bad cached file can be found and deleted to make that text again.
+
+    Args:
+        unique_texts (dict[_TextKey, list[tuple[dict[str, str], Path]]]): from group_by_text(), modified in place.
+        cache_dir (Path): directory of cached output files named "<cache key>.mp3", created if it doesn't exist.
+        cache_key (Callable[[_TextKey], str]): gets the cache key of a text, a hash of everything that affects
+            its audio.
+
+    Returns:
+        tuple[dict[_TextKey, Path], int]: (text key -> cache path of each text still to be made,
+            number of files copied from the cache)
+
+    Raises:
+        OSError: If the cache directory could not be created, or a cached file could not be copied.
+
+    """
+    cache_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
+    cache_paths: dict[_TextKey, Path] = {}
+    copied_count: int = 0
+    for key in list(unique_texts):
+        cache_path: Path = cache_dir / f"{cache_key(key)}.mp3"
+        if not cache_path.is_file():
+            cache_paths[key] = cache_path
+            continue
+        for _, file_path in unique_texts.pop(key):
+            shutil.copyfile(cache_path, file_path)
+            logger.info("Copied %s from cache file %s", file_path, cache_path)
+            copied_count += 1
+    return cache_paths, copied_count
+
+
+def fan_out(same_text: list[tuple[dict[str, str], Path]], cache_path: Path | None = None) -> None:
+    """Share the file made for a text with the other files of the same text, and add it to the cache.
+
+    Args:
+        same_text (list[tuple[dict[str, str], Path]]): a group from group_by_text(). The first file must
+            already be made, the others are hard linked or copied from it, see link_or_copy().
+        cache_path (Path | None): cache path to add the file to, see copy_cached(). A cache write failure
+            only costs making the file again on a later run, so it's logged and ignored. Default None, no cache.
+
+    Raises:
+        OSError: If a file could not be linked or copied.
+
+    """
+    made_path: Path = same_text[0][1]
+    if cache_path is not None:
+        # atomic, so an interrupted copy never leaves a truncated file under its hash
+        try:
+            copy_atomic(made_path, cache_path)
+        except OSError:
+            logger.warning("Could not add %s to cache", made_path, exc_info=True)
+    for _, file_path in same_text:
+        if file_path != made_path:
+            link_or_copy(made_path, file_path)
+
+
+def make_unique_texts(
+    executor: ThreadPoolExecutor,
+    unique_texts: dict[_TextKey, list[tuple[dict[str, str], Path]]],
+    process_item: Callable[[_TextKey, dict[str, str], Path], int],
+    cache_paths: dict[_TextKey, Path],
+    progress: Callable[[int], None],
+    progress_interval: int,
+    cancel_event: threading.Event | None = None,
+) -> tuple[int, int]:
+    """Make the first file of each text with a TTS service's worker pool, then fan it out to the rest.
+
+    Texts are submitted in unique_texts order. A line per file floods the log on large templates, so each file
+    is logged at DEBUG and progress is only reported every progress_interval files. If an item fails, or on
+    Ctrl-C or an unexpected error, queued items are cancelled before returning, otherwise every one of them
+    would still be sent to the service and billed. The same happens once cancel_event is set, which lets
+    another thread stop the run, since KeyboardInterrupt is only raised in the main thread. In-progress items
+    are left to finish.
+
+    Args:
+        executor (ThreadPoolExecutor): the run's worker pool
+        unique_texts (dict[_TextKey, list[tuple[dict[str, str], Path]]]): from group_by_text(), the texts to make
+        process_item (Callable[[_TextKey, dict[str, str], Path], int]): makes the file of a text key's first
+            item, run in worker threads. Returns 0 on success, 1 on error that should stop processing, 2 if the
+            item was skipped.
+        cache_paths (dict[_TextKey, Path]): text key -> cache path to add each made file to, see fan_out()
+        progress (Callable[[int], None]): logs progress, called with the number of files created so far
+        progress_interval (int): call progress every this many created files
+        cancel_event (threading.Event | None): checked as each item finishes, set to stop the run.
+            Defaults to None, not cancellable.
+
+    Returns:
+        tuple[int, int]: (0 on success, 1 on error or if cancelled, number of files created)
+
+    """
+    created_count: int = 0
+    futures: dict[Future[int], _TextKey] = {
+        executor.submit(process_item, text_key, *same_text[0]): text_key
+        for text_key, same_text in unique_texts.items()
+    }
+    try:
+        for future in as_completed(futures):
+            retcode: int = future.result()
+            if retcode == 1:
+                executor.shutdown(wait=True, cancel_futures=True)
+                return 1, created_count
+            if retcode == 0:
+                same_text: list[tuple[dict[str, str], Path]] = unique_texts[futures[future]]
+                try:
+                    fan_out(same_text, cache_paths.get(futures[future]))
+                except OSError:
+                    logger.exception("Error linking or copying %s to duplicate text files", same_text[0][1])
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    return 1, created_count
+                for _, file_path in same_text:
+                    created_count += 1
+                    logger.debug("Created file %d: %s", created_count, file_path)
+                    if created_count % progress_interval == 0:
+                        progress(created_count)
+
+            if cancel_event is not None and cancel_event.is_set():
+                logger.warning("Cancelled, waiting for items in progress to finish")
+                executor.shutdown(wait=True, cancel_futures=True)
+                return 1, created_count
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    return 0, created_count
+
+
+class RateLimiter:
+    """Token bucket rate limiter for API requests, shared by worker threads.
+
+    Keeps requests just under a service's rate limit, so they aren't rejected and retried with backoff.
+    Up to `burst` requests may start at once, then they're spaced 1/rate seconds apart.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """Create a rate limiter.
+
+        Args:
+            rate (float): max requests per second, on average.
+            burst (int): max requests that may start at once after a pause. Default 1.
+
+        Raises:
+            ValueError: If rate or burst is not positive.
+
+        """
+        if rate <= 0 or burst < 1:
+            msg = f"Invalid rate limit {rate}/s with burst {burst}."
+            raise ValueError(msg)
+        self.rate: float = rate
+        self.burst: int = burst
+        self._tokens: float = float(burst)
+        self._updated: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Wait until the next request may start.
+
+        A token is reserved under the lock and the wait happens outside it, so each waiting thread
+        gets its own start time instead of all of them waking up at once.
+
+        """
+        with self._lock:
+            now: float = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            wait: float = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
 def trim_silence(filepath: str, silence_threshold: float = -30.0, min_silence_duration: float = 0.2) -> str:
     """Trim silence from the beginning and end of an audio file using ffmpeg silenceremove filter.
 
@@ -83,6 +632,63 @@ def trim_silence(filepath: str, silence_threshold: float = -30.0, min_silence_du
     input_stream = input_stream.aformat(sample_fmts="dblp")
     input_stream = input_stream.areverse()
 
-    input_stream.output(filename=output_filepath).run(quiet=True)
+    input_stream.output(filename=output_filepath, extra_options={"threads": FFMPEG_THREADS}).global_args(
+        hide_banner=True, loglevel="error", filter_threads=FFMPEG_THREADS, filter_complex_threads=FFMPEG_THREADS
+    ).run(cmd=FFMPEG_BIN, quiet=True)
 
     return output_filepath
+
+
+def walk_files(
+    root: str | Path, suffix: str = "", skip_dirs: Container[str] = (), *, skip_hidden: bool = False
+) -> Iterator[tuple[str, str]]:
+    """Recursively yield every file under a directory, optionally only those with a given suffix.
+
+    Uses os.scandir so file type checks come from the cached directory entry instead of
+    a separate stat call per file. Symlinks are not followed.
+
+    Relative paths are built up by string concatenation during the walk, always with "/"
+    separators to match template paths regardless of OS.
+
+    Skipped directories are pruned from the walk, so nothing below them is listed at all.
+
+    Args:
+        root (str | Path): directory to search.
+        suffix (str): only yield files whose name ends with this, ignoring case, e.g. ".mp3" also matches
+            "Foo.MP3" like a glob on Windows. Default all files.
+        skip_dirs (Container[str]): names of subdirectories to skip, e.g. {"voicelines"}. Default none.
+        skip_hidden (bool): skip subdirectories whose name starts with ".", e.g. ".git". Default False.
+
+    Yields:
+        tuple[str, str]: (path, path relative to root) of each file found.
+
+    """
+    suffix = suffix.casefold()
+    stack: list[tuple[str, str]] = [(str(root), "")]
+    while stack:
+        dirpath, prefix = stack.pop()
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in skip_dirs or (skip_hidden and entry.name.startswith(".")):
+                        continue
+                    stack.append((entry.path, prefix + entry.name + "/"))
+                elif entry.name.casefold().endswith(suffix) and entry.is_file(follow_symlinks=False):
+                    yield entry.path, prefix + entry.name
+
+
+def walk_mp3(
+    root: str | Path, skip_dirs: Container[str] = (), *, skip_hidden: bool = False
+) -> Iterator[tuple[str, str]]:
+    """Recursively yield every .mp3 file under a directory. See walk_files().
+
+    Args:
+        root (str | Path): directory to search.
+        skip_dirs (Container[str]): names of subdirectories to skip. Default none.
+        skip_hidden (bool): skip subdirectories whose name starts with ".". Default False.
+
+    Yields:
+        tuple[str, str]: (path, path relative to root) of each .mp3 file found.
+
+    """
+    return walk_files(root, ".mp3", skip_dirs, skip_hidden=skip_hidden)
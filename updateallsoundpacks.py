@@ -9,59 +9,93 @@ New soundpacks can be created by creating a new folder with the correct name and
 """
 
 import argparse
-import json
 import logging
 import os
 import sys
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from json import JSONDecodeError
 from pathlib import Path
 from typing import TYPE_CHECKING, Literal, cast
 
 import ttsmapi
 from boto3 import Session
-from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
 from mypy_boto3_polly.literals import VoiceIdType  # noqa: TC002
 
 # from mypy_boto3_service_quotas.type_defs import ListServiceQuotasResponseTypeDef  # noqa: TC002
-from requests import HTTPError, JSONDecodeError
+from requests import HTTPError
 from ttsmapi.exceptions import TTSMAPIError
 
 import ttsfromtemplate_awspolly
 import ttsfromtemplate_ttsmonster
+import ttsutil
 
 logger = logging.getLogger(__name__)
 
 if TYPE_CHECKING:
+    from botocore.client import BaseClient
     from mypy_boto3_polly.client import PollyClient
     # from mypy_boto3_service_quotas.client import ServiceQuotasClient
 
 
 def _count_missing_for_service(
-    base_dir: Path, template_data: list[dict], dir_prefix: str, *, log_missing: bool = False
-) -> tuple[list[Path], int, int]:
-    """Return (dirs, num_missing_files, num_missing_chars) for soundpacks matching prefix.
+    dirs: list[Path], template_paths: list[tuple[str, str, int]], *, log_missing: bool = False
+) -> tuple[int, int]:
+    """Return (num_missing_files, num_missing_chars) for the soundpacks of one TTS service.
 
     Args:
-        base_dir (Path): parent directory containing soundpack directories
-        template_data (list[dict]): loaded template data
-        dir_prefix (str): lower-case prefix to match directory names (e.g. 'awspolly-')
+        dirs (list[Path]): soundpack directories of the service
+        template_paths (list[tuple[str, str, int]]): (path, canonical path, TTS text length) of each template item,
+            see ttsutil.canonical_path()
         log_missing (bool): if True, log each missing file path. Default False.
 
     Returns:
-        tuple[list[Path], int, int]: (list of matching dirs, number of missing files, number of missing TTS characters)
+        tuple[int, int]: (number of missing files, number of missing TTS characters)
 
     """
-    dirs: list[Path] = [d for d in base_dir.iterdir() if d.is_dir() and d.name.lower().startswith(dir_prefix)]
     num_missing_files = 0
     num_missing_chars = 0
     for pack_dir in dirs:
-        for item in template_data:
-            file_fullpath: Path = pack_dir / "sounds" / item["path"]
-            if not file_fullpath.exists():
+        sounds_dir: Path = pack_dir / "sounds"
+        # walk each sounds dir once instead of checking each template path with its own stat
+        existing_paths: set[str] = (
+            {ttsutil.canonical_path(relpath) for _, relpath in ttsutil.walk_files(sounds_dir)}
+            if sounds_dir.is_dir()
+            else set()
+        )
+        for path, canonical_path, num_chars in template_paths:
+            if canonical_path not in existing_paths:
                 num_missing_files += 1
-                num_missing_chars += len(item.get("tts_text", ""))
+                num_missing_chars += num_chars
                 if log_missing:
-                    logger.info("Missing: %s", file_fullpath)
-    return dirs, num_missing_files, num_missing_chars
+                    logger.info("Missing: %s", sounds_dir / path)
+    return num_missing_files, num_missing_chars
+
+
+def _update_soundpack(soundpack_dir: Path, create_files: Callable[[str, Path], int]) -> int:
+    """Create missing TTS files in one soundpack dir.
+
+    Args:
+        soundpack_dir (Path): soundpack directory named "<SERVICE>-<Voice>"
+        create_files (Callable[[str, Path], int]): creates the TTS files of a (voice, soundpack dir),
+            returning 0 on success, 1 on error
+
+    Returns:
+        int: 0 on success or if skipped, 1 on error
+
+    """
+    voice: str = soundpack_dir.name.split("-", 1)[1]
+    sounds_dir: Path = soundpack_dir / "sounds"
+    if not sounds_dir.is_dir():
+        logger.info("No 'sounds' subfolder in '%s', skipping.", soundpack_dir.name)
+        return 0
+    logger.info("Creating TTS files in soundpack folder '%s'...", soundpack_dir.name)
+    if create_files(voice, soundpack_dir) != 0:
+        logger.error("Error: processing soundpack '%s'.", soundpack_dir.name)
+        return 1
+    return 0
 
 
 def update_all_soundpacks(
@@ -71,15 +105,36 @@ def update_all_soundpacks(
     log_missing: bool = False,
     quality_checks: bool = True,
     enforce_char_quota: bool = True,
+    use_cache: bool = True,
+    ttsm_cache: bool = False,
+    polly_max_rate: float | None = None,
+    ttsm_max_rate: float | None = None,
+    s3_bucket: str | None = None,
+    yes: bool = False,
+    dry_run: bool = False,
 ) -> int:
     """Update all soundpack folders in the specified directory using the specified TTS template file.
 
+    Soundpacks of different TTS services are updated concurrently, those of the same service one at a time.
+
     Args:
         template_file (Path, optional): Path to the template JSON file.
             Defaults to "template.json".
         base_dir (Path, optional): Directory containing soundpack subdirectories.
             Defaults to current working directory.
         log_missing (bool, optional): If True, log each missing TTS file path. Default False.
+        use_cache (bool, optional): If True, reuse output files cached by content in each service's
+            DEFAULT_CACHE_DIR, shared by every soundpack, instead of generating them again. Default True.
+        ttsm_cache (bool, optional): If True, also use the TTS.Monster cache. TTS.Monster takes vary, and a
+            bad one that passed quality checks would be reused by every soundpack and run. Default False.
+        polly_max_rate (float | None, optional): max AWS Polly requests per second. Default None, no limit.
+        ttsm_max_rate (float | None, optional): max TTS.Monster requests per second. Default None, no limit.
+        s3_bucket (str | None, optional): if set, AWS Polly soundpacks with many missing files use
+            asynchronous speech synthesis tasks that write to this S3 bucket. Default None.
+        yes (bool, optional): If True, don't ask for confirmation before creating TTS files, e.g. for
+            scheduled runs. Default False.
+        dry_run (bool, optional): If True, only report missing files, without connecting to any TTS service
+            or creating files. Default False.
 
     Returns:
         int: 0 on success, 1 on error
@@ -97,16 +152,55 @@ def update_all_soundpacks(
         return 1
 
     try:
-        with template_file.open(encoding="utf-8") as f:
-            template_data = json.load(f)
-    except (JSONDecodeError, UnicodeDecodeError):
+        template_data: list[dict[str, str]] = ttsutil.load_template(template_file)
+    except (OSError, JSONDecodeError, UnicodeDecodeError):
         logger.exception("Error reading template")
         return 1
 
+    # Template paths are normalized once here, instead of for every soundpack of both services.
+    template_paths: list[tuple[str, str, int]] = [
+        (item["path"], ttsutil.canonical_path(item["path"]), len(item.get("tts_text", ""))) for item in template_data
+    ]
+    # List the base dir once for both services. The name is checked first, and os.scandir entries usually
+    # know whether they're directories without a stat, so other files in the base dir cost nothing.
+    awspolly_dirs: list[Path] = []
+    ttsm_dirs: list[Path] = []
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            name: str = entry.name.lower()
+            if name.startswith("awspolly-") and entry.is_dir():
+                awspolly_dirs.append(Path(entry.path))
+            elif name.startswith("ttsm-") and entry.is_dir():
+                ttsm_dirs.append(Path(entry.path))
+
     # Calculate the total number of characters of 'tts_text' for missing files in all awspolly soundpacks
-    awspolly_dirs, awspolly_num_missing_files, awspolly_num_missing_chars = _count_missing_for_service(
-        base_dir=base_dir, template_data=template_data, dir_prefix="awspolly-", log_missing=log_missing
+    awspolly_num_missing_files, awspolly_num_missing_chars = _count_missing_for_service(
+        dirs=awspolly_dirs, template_paths=template_paths, log_missing=log_missing
+    )
+
+    # Calculate the total number of characters of 'tts_text' for missing files in all TTSM soundpacks
+    ttsm_num_missing_files, ttsm_num_missing_chars = _count_missing_for_service(
+        dirs=ttsm_dirs, template_paths=template_paths, log_missing=log_missing
+    )
+
+    logger.info(
+        "AWSPolly soundpacks are missing %d files with a total of %d TTS characters.",
+        awspolly_num_missing_files,
+        awspolly_num_missing_chars,
+    )
+    logger.info(
+        "TTSM soundpacks are missing %d files with a total of %d TTS characters.",
+        ttsm_num_missing_files,
+        ttsm_num_missing_chars,
     )
+
+    if awspolly_num_missing_files == 0 and ttsm_num_missing_files == 0:
+        logger.info("No TTS files specified in template are missing in any soundpack dir, exiting.")
+        return 0
+    if dry_run:
+        logger.info("Dry run, exiting without creating any TTS files.")
+        return 0
+
     if awspolly_num_missing_files > 0:
         try:
             aws_profile: str = os.environ["AWS_PROFILE"]
@@ -115,11 +209,32 @@ def update_all_soundpacks(
             return 1
 
         try:
-            polly_client: PollyClient = Session(profile_name=aws_profile).client("polly")  # type: ignore[attr-defined]
+            polly_client: PollyClient = Session(profile_name=aws_profile).client(  # type: ignore[attr-defined]
+                "polly", config=ttsfromtemplate_awspolly.POLLY_CLIENT_CONFIG
+            )
         except (ClientError, NoCredentialsError):
             logger.exception("Failed to initialize AWS Polly client")
             return 1
 
+        # Boto3 resolves credentials and opens its first connection lazily. Do that now with a cheap call, so an
+        # auth problem is reported before the prompt instead of by the first soundpack, and the pooled
+        # connection is already open when it starts.
+        try:
+            ttsfromtemplate_awspolly.describe_voice_ids(polly_client)
+        except (BotoCoreError, ClientError):
+            logger.exception("Failed to connect to AWS Polly, check AWS credentials for profile %s", aws_profile)
+            return 1
+
+        s3_client: BaseClient | None = None
+        if s3_bucket:
+            try:
+                s3_client = Session(profile_name=aws_profile).client(
+                    "s3", config=ttsfromtemplate_awspolly.POLLY_CLIENT_CONFIG
+                )
+            except (ClientError, NoCredentialsError):
+                logger.exception("Failed to initialize AWS S3 client")
+                return 1
+
         # TODO(cdr): Figure out how to actually get the SynthesizeSpeech quota(s) from AWS Polly
         # service_quotas_client: ServiceQuotasClient = Session(profile_name=aws_profile).client('service-quotas')  # type: ignore[attr-defined]
         # service_quotas: ListServiceQuotasResponseTypeDef = service_quotas_client.list_service_quotas(ServiceCode='polly')
@@ -127,10 +242,6 @@ def update_all_soundpacks(
 
         # logger.info("AWS Polly account has %s characters remaining in this billing period.", synthesize_speech_quota)
 
-    # Calculate the total number of characters of 'tts_text' for missing files in all TTSM soundpacks
-    ttsm_dirs, ttsm_num_missing_files, ttsm_num_missing_chars = _count_missing_for_service(
-        base_dir=base_dir, template_data=template_data, dir_prefix="ttsm-", log_missing=log_missing
-    )
     if ttsm_num_missing_files > 0:
         try:
             ttsm_apikey: str = os.environ["TTSMONSTER_API_KEY"]
@@ -149,64 +260,70 @@ def update_all_soundpacks(
         )
         logger.info("TTSM account has %d characters remaining in this billing period.", ttsm_remaining_chars)
 
-    logger.info(
-        "AWSPolly soundpacks are missing %d files with a total of %d TTS characters.",
-        awspolly_num_missing_files,
-        awspolly_num_missing_chars,
-    )
-    logger.info(
-        "TTSM soundpacks are missing %d files with a total of %d TTS characters.",
-        ttsm_num_missing_files,
-        ttsm_num_missing_chars,
-    )
-
-    if awspolly_num_missing_files > 0 or ttsm_num_missing_files > 0:
+    if not yes:
         prompt = "You are responsible for any TTS generation fees incurred. Proceed? (y/n): "
         if input(prompt).strip().lower() != "y":
             print("'n' selected, exiting.")  # noqa: T201
             return 0
-    else:
-        logger.info("No TTS files specified in template are missing in any soundpack dir, exiting.")
-        return 0
 
     logger.info("Using template file '%s' to update soundpack folders in '%s'.", template_file, base_dir)
 
-    if awspolly_num_missing_files > 0:
-        for soundpack_dir in awspolly_dirs:
-            voice: str = soundpack_dir.name.split("-", 1)[1]
-            sounds_dir: Path = soundpack_dir / "sounds"
-            if not sounds_dir.exists() or not sounds_dir.is_dir():
-                logger.info("No 'sounds' subfolder in '%s', skipping.", soundpack_dir.name)
-                continue
-            logger.info("Creating TTS files in soundpack folder '%s'...", soundpack_dir.name)
-            retcode: int = ttsfromtemplate_awspolly.ttsfromtemplate_awspolly(
-                polly_client=polly_client,  # type: ignore
-                voiceid=cast("VoiceIdType", voice),
-                template_file=template_file,
-                output_dir=soundpack_dir,
-            )
-            if retcode != 0:
-                logger.error("Error: processing soundpack '%s'.", soundpack_dir.name)
+    # set on Ctrl-C or an unexpected error, to stop the soundpack in progress in each service's worker thread
+    cancel_event = threading.Event()
+
+    def create_awspolly_files(voice: str, soundpack_dir: Path) -> int:
+        return ttsfromtemplate_awspolly.ttsfromtemplate_awspolly(
+            polly_client=polly_client,  # type: ignore
+            voiceid=cast("VoiceIdType", voice),
+            template_file=template_file,
+            output_dir=soundpack_dir,
+            cache_dir=ttsfromtemplate_awspolly.DEFAULT_CACHE_DIR if use_cache else None,
+            max_rate=polly_max_rate,
+            s3_client=s3_client,  # type: ignore
+            s3_bucket=s3_bucket,
+            cancel_event=cancel_event,
+        )
+
+    def create_ttsm_files(voice: str, soundpack_dir: Path) -> int:
+        return ttsfromtemplate_ttsmonster.ttsfromtemplate_ttsmonster(
+            ttsmapi_client=ttsmapi_client,  # type: ignore
+            voice=voice,
+            template_file=template_file,
+            output_dir=soundpack_dir,
+            quality_checks=quality_checks,
+            cache_dir=ttsfromtemplate_ttsmonster.DEFAULT_CACHE_DIR if use_cache and ttsm_cache else None,
+            max_rate=ttsm_max_rate,
+            cancel_event=cancel_event,
+        )
 
+    services: list[tuple[list[Path], Callable[[str, Path], int]]] = []
+    if awspolly_num_missing_files > 0:
+        services.append((awspolly_dirs, create_awspolly_files))
     if ttsm_num_missing_files > 0:
-        for soundpack_dir in ttsm_dirs:
-            voice: str = soundpack_dir.name.split("-", 1)[1]
-            sounds_dir: Path = soundpack_dir / "sounds"
-            if not sounds_dir.exists() or not sounds_dir.is_dir():
-                logger.info("No 'sounds' subfolder in '%s', skipping.", soundpack_dir.name)
-                continue
-            logger.info("Creating TTS files in soundpack folder '%s'...", soundpack_dir.name)
-            retcode: int = ttsfromtemplate_ttsmonster.ttsfromtemplate_ttsmonster(
-                ttsmapi_client=ttsmapi_client,  # type: ignore
-                voice=voice,
-                template_file=template_file,
-                output_dir=soundpack_dir,
-                quality_checks=quality_checks,
-            )
-            if retcode != 0:
-                logger.error("Error: processing soundpack '%s'.", soundpack_dir.name)
+        services.append((ttsm_dirs, create_ttsm_files))
 
-    return 0
+    # Each service has its own API and rate limits, so update both services' soundpacks at the same time.
+    # A single worker executor per service keeps that service's soundpacks one at a time, and leaves the
+    # soundpacks not yet started as queued futures that can be cancelled.
+    executors: list[ThreadPoolExecutor] = [ThreadPoolExecutor(max_workers=1) for _ in services]
+    try:
+        futures: list[Future[int]] = [
+            executor.submit(_update_soundpack, soundpack_dir, create_files)
+            for executor, (dirs, create_files) in zip(executors, services, strict=True)
+            for soundpack_dir in dirs
+        ]
+        return max(future.result() for future in as_completed(futures))
+    except BaseException:
+        # On Ctrl-C or an unexpected error, cancel the queued soundpacks of both services, otherwise each of
+        # them would still be updated. KeyboardInterrupt is only raised in this thread, so the soundpack in
+        # progress in each service is stopped with cancel_event, after the items it has in progress.
+        cancel_event.set()
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
 
 
 def main() -> int:
@@ -222,6 +339,20 @@ def main() -> int:
         "-d", "--directory", help="the directory containing soundpack subdirectories to update", default=str(Path.cwd())
     )
     parser.add_argument("-m", "--missing", help="output list of missing TTS files", action="store_true")
+    parser.add_argument(
+        "-y",
+        "--yes",
+        help="create missing TTS files without asking for confirmation, you are responsible for any fees",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        help="only report missing TTS files, don't connect to any TTS service or create files",
+        action="store_true",
+        default=False,
+    )
     parser.add_argument(
         "--skipqa",
         help="disable quality checks for generated TTS files",
@@ -234,6 +365,35 @@ def main() -> int:
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "--no-cache",
+        help="don't read or add to the output file caches shared by all soundpacks",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--ttsm-cache",
+        help="also use the TTS.Monster output file cache, which is off by default",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--polly-max-rate",
+        help="max AWS Polly requests per second, e.g. the account's TPS quota",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--ttsm-max-rate",
+        help="max TTS.Monster requests per second",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--s3-bucket",
+        help="use asynchronous AWS Polly speech synthesis tasks that write to this S3 bucket, for large updates",
+        default=None,
+    )
     parser.add_argument(
         "-l",
         "--log-level",
@@ -242,6 +402,9 @@ def main() -> int:
         default=None,
     )
     args: argparse.Namespace = parser.parse_args()
+    for max_rate in (args.polly_max_rate, args.ttsm_max_rate):
+        if max_rate is not None and max_rate <= 0:
+            parser.error("max rates must be greater than 0")
 
     level: Literal[20] = getattr(logging, args.log_level) if args.log_level else logging.INFO
     logging.basicConfig(level=level, format="%(levelname)s: %(message)s")
@@ -252,6 +415,13 @@ def main() -> int:
         log_missing=bool(args.missing),
         quality_checks=not bool(args.skipqa),
         enforce_char_quota=not bool(args.ignorequota),
+        use_cache=not bool(args.no_cache),
+        ttsm_cache=bool(args.ttsm_cache),
+        polly_max_rate=args.polly_max_rate,
+        ttsm_max_rate=args.ttsm_max_rate,
+        s3_bucket=args.s3_bucket,
+        yes=bool(args.yes),
+        dry_run=bool(args.dry_run),
     )
 
 